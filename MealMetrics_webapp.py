@@ -1,120 +1,131 @@
+import time
+
 import streamlit as st
 from streamlit_option_menu import option_menu
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from streamlit_echarts import st_echarts
-
-# Set the page layout to wide
-st.set_page_config(layout="wide")
-
-# Load or preprocess your data here
-# For example, you can load a CSV file into a pandas DataFrame
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-
-# Define the scope
-scope = ["https://spreadsheets.google.com/feeds", 'https://www.googleapis.com/auth/spreadsheets',
-         "https://www.googleapis.com/auth/drive.file", "https://www.googleapis.com/auth/drive"]
-
-# Add credentials to the account
-creds = ServiceAccountCredentials.from_json_keyfile_name('proven-yen-409211-2ee88f35110a.json', scope)
-
-# Authorize the clientsheet
-client = gspread.authorize(creds)
-
-# Open the spreadhseet
-sheet = client.open('mealmetrics_data').sheet1
-
-# Get the data
-data_ = sheet.get_all_records()
-
-# Convert to DataFrame
-data = pd.DataFrame(data_)
-
-# Add on_change callback
-def on_change(key):
-    selection = st.session_state[key]
-
-selected_page = option_menu(None, ["HOMEPAGE", "PANEL", "ABOUT", 'CONTACT'],
-                            icons=['house', 'map', "info-circle", 'envelope'],
-                            on_change=on_change, key='menu', orientation="horizontal",
-                            styles={
-                                "container": {"padding": "4px", "background-color": "#f0f0f0", "border-radius": "10px", "width": "100%"},  # Set the container width to 100%
-                                "icon": {"color": "#606060", "font-size": "18px"},  # Increase the font size for icons
-                                "nav-link": {"font-size": "18px", "text-align": "center", "margin": "0px", "color": "#505050", "font-weight": "normal"},  # Increase font size for text
-                                "nav-link-selected": {"background-color": "#B0A4E6", "color": "black", "font-weight": "normal"},  # Darker shade of light violet and normal font weight
-                            })
-
-# Page layouts
-if selected_page == 'HOMEPAGE':
-    st.title('Welcome to MealMetrics!')
-
-    # Banner Image
-    # st.image('homepage_banner.jpg', use_column_width=True)
-
-    # Introduction and Description
-    st.markdown("""
-    ## 🥗 MealMetrics: Your Dietary Insight Tool
-    MealMetrics is a webapp designed to analyze and visualize dietary habits based on user-submitted data. 
-    The data is collected from various sources and is used to provide insights into dietary patterns, preferences, and nutrition considerations.
-
-    - **Data Collection:** Through online surveys focusing on dietary habits, meal frequency, nutritional considerations, and more.
-    - **Purpose:** To help users understand eating habits and make informed decisions about their diet and nutrition.
-    - **Data Description:** Metrics like meal frequency, dietary preferences, nutritional value, etc., from diverse individuals.
-    """)
 
-    # Interactive Data Preview Section
-    st.subheader('🔍 Preview of Collected Data')
-    # Load and display a snippet of the data
-    # Assuming 'data' is your DataFrame
-    data_to_display = data.drop(data.columns[[0, 1]], axis=1)  # Dropping the first two columns
-    st.dataframe(data_to_display)  # Display the modified DataFrame
+from instrumentation import (DEBUG_PANEL, STARTUP_REPORT, begin_rerun, end_rerun, mark_first_paint, metrics,
+                             startup_report, startup_timer, timed)
+from page_registry import page, page_icons, page_names, provider, render
 
-    # Detailed Data Description
-    st.markdown("""
-    ### 📊 Detailed Data Description
+RERUN_START = time.perf_counter()
+begin_rerun()
 
-    - **Gender:** The gender of the respondent.
-    - **Dietary Preferences:** Choices like vegetarian, vegan, keto, etc.
-    - **Meal Frequency:** Number of meals eaten in a day.
-    - **Nutritional Consideration:** Focus on nutritional info when choosing food.
-    - **Fruits and Vegetables Consumption:** Frequency of consumption.
-    - **Whole Grains Consumption:** Inclusion of whole grains in meals.
-    - **Snacking Habits:** Information about snacking between meals.
-    - **Eating Out Frequency:** How often eating out occurs weekly.
-    - **Food Label Reading Habits:** Regular reading of food labels for nutrition.
-    - **Steps to Improve Diet:** Actions taken to improve diet.
-    - **Health Consciousness:** Measure of diet-related health awareness.
-    - **Food Selection Priorities:** Factors prioritized in food selection (taste, cost, health benefits).
-
-    This data helps create interactive visualizations for insights into dietary habits.
-    """)
-
-    # Visual Element: Interactive Charts or Graphs
-    st.subheader('📈 Interactive Diet Insights')
-    # Example: Display an interactive chart based on the data
-    # st.plotly_chart(some_plotly_chart_based_on_data)
-
-    # Footer
-    st.markdown("---")
-    st.markdown("© 2023 MealMetrics - Unveiling Dietary Patterns")
-
-if selected_page == 'PANEL':
-    st.title('📊 Dashboard')
-    st.markdown('''
-        This dashboard presents a visual analysis of dietary habits, offering insights into the balance between healthy and junk food choices.
-        ''')
-
-    # Banner Image for Dashboard
-    # st.image('dashboard_banner.jpg', use_column_width=True)
-
-    # Sunburst Chart for Healthy vs Junk Food
-    st.subheader('🍏 Healthy Food vs Junk Food 🍔')
-    st.markdown('Explore the comparative overview of healthy and junk food items:')
+# Set the page layout to wide
+st.set_page_config(layout="wide")
 
-    # Example data structure for healthy and junk foods
-    food_data = [
+# Pandas, the plotting stack and the Sheets client are imported by the pages
+# that need them, so ABOUT and CONTACT never pay for them.
+
+
+# Snapshot of the shared survey data for this rerun. A background refresher
+# keeps the shared cache up to date, so a rerun never goes back to Google Sheets
+# itself, and every provider of the rerun reads this one snapshot even if a
+# newer one is published meanwhile.
+def survey_snapshot():
+    with startup_timer('data layer'):
+        from data_loader import sheet_cache
+        from refresher import keep_fresh, warm_up
+
+    keep_fresh(sheet_cache)
+    # A manual refresh re-downloads the whole sheet, picking up edits as well as
+    # new responses. This one waits for it.
+    if st.sidebar.button('🔄 Refresh data'):
+        sheet_cache.invalidate(full=True)
+        try:
+            sheet_cache.update(warm_up)
+        except Exception:
+            pass  # reported below, with the last good data still shown
+    try:
+        snapshot = sheet_cache.snapshot()
+    except Exception as error:
+        st.warning(f'The survey data could not be loaded from Google Sheets ({error}). '
+                   f'Please try again in {sheet_cache.retry_in():.0f} seconds.')
+        st.stop()
+    st.sidebar.caption(f'Data version {snapshot.version}')
+    if sheet_cache.last_error is not None:
+        st.sidebar.warning(f'Google Sheets could not be reached ({sheet_cache.last_error}), so the data may be out '
+                           f'of date. Retrying in {sheet_cache.retry_in():.0f} seconds.')
+    return snapshot
+
+
+# Pages register the data they depend on, and only that data is loaded when the
+# page is shown
+@provider('survey')
+def load_survey():
+    return survey_snapshot()
+
+
+@provider('frame', needs=['survey'])
+def load_frame(survey):
+    return survey.get()
+
+
+# Aggregates computed once per data version
+@provider('cube', needs=['survey'])
+def load_cube(survey):
+    return survey.cube()
+
+
+# Daily trends, brought up to date with only the responses added since the
+# previous data version
+@provider('trends', needs=['survey'])
+def load_trends(survey):
+    return survey.trends()
+
+
+# The sidebar filters of PANEL, as {column: [answers]}
+@provider('panel_filters', needs=['survey', 'cube'])
+def load_panel_filters(survey, cube):
+    from filters import FILTER_COLUMNS
+
+    st.sidebar.subheader('🔎 Filters')
+    # In streaming mode only the aggregates of the whole sheet are kept
+    if survey.rows > len(survey.get()):
+        st.sidebar.caption('Filters are not available in streaming mode')
+        return {}
+    filters = {}
+    for column in FILTER_COLUMNS:
+        if column in cube['counts']:
+            answers = st.sidebar.multiselect(column, cube['counts'][column].index.tolist(), key=f'filter {column}')
+            if answers:
+                filters[column] = answers
+    return filters
+
+
+# The cube of the responses matching the PANEL filters. Filters resolve on
+# bitmap indexes built once per data version, and filtered cubes are kept per
+# filter combination.
+@provider('panel_cube', needs=['survey', 'cube', 'panel_filters'])
+def load_panel_cube(survey, cube, panel_filters):
+    from filters import build_index, filter_cube, filtered_cubes
+
+    if not panel_filters:
+        return cube
+    index = survey.artifact('filter index', build_index)
+    filtered = filtered_cubes.get(survey.version, panel_filters,
+                                  lambda: filter_cube(survey.get(), index, panel_filters, habits=survey.habits()))
+    st.sidebar.caption(f'{filtered["rows"]} of {cube["rows"]} responses match')
+    return filtered
+
+
+# Association statistics between the survey questions among the responses
+# matching the PANEL filters, kept like the filtered cubes
+@provider('panel_associations', needs=['survey', 'panel_filters'])
+def load_panel_associations(survey, panel_filters):
+    from associations import build_associations
+    from filters import build_index, filter_cube, filtered_cubes
+
+    if not panel_filters:
+        return survey.associations()
+    index = survey.artifact('filter index', build_index)
+    return filtered_cubes.get((survey.version, 'associations'), panel_filters,
+                              lambda: filter_cube(survey.get(), index, panel_filters, build_associations))
+
+
+# Example data structure for healthy and junk foods
+@provider('food_tree', static=True)
+def food_tree():
+    return [
         {
             "name": "Healthy Food",
             "children": [
@@ -183,6 +194,211 @@ if selected_page == 'PANEL':
         },
     ]
 
+
+# Diet types and their characteristics
+@provider('diet_tree', static=True)
+def diet_tree():
+    return {
+        "name": "Diet Types",
+        "children": [
+            {
+                "name": "Vegetarian",
+                "children": [
+                    {"name": "Lacto-vegetarian",
+                     "children": [{"name": "Dairy products included"}, {"name": "No eggs or meat"}]},
+                    {"name": "Ovo-vegetarian", "children": [{"name": "Eggs included"}, {"name": "No dairy or meat"}]},
+                    {"name": "Lacto-ovo vegetarian",
+                     "children": [{"name": "Includes dairy and eggs"}, {"name": "No meat"}]},
+                    {"name": "Flexitarian",
+                     "children": [{"name": "Primarily vegetarian"}, {"name": "Occasional meat consumption"}]},
+                ],
+            },
+            {
+                "name": "Vegan",
+                "children": [
+                    {"name": "Raw vegan",
+                     "children": [{"name": "Only uncooked foods"}, {"name": "No animal products"}]},
+                    {"name": "Whole-food vegan",
+                     "children": [{"name": "Whole plant foods"}, {"name": "Minimally processed"}]},
+                ],
+            },
+            {
+                "name": "Pescatarian",
+                "children": [
+                    {"name": "Mediterranean",
+                     "children": [{"name": "Fish and seafood"}, {"name": "Plant-based with olive oil"}]},
+                    {"name": "Nordic", "children": [{"name": "Seafood-rich"}, {"name": "Includes root vegetables"}]},
+                ],
+            },
+            {
+                "name": "Ketogenic",
+                "children": [
+                    {"name": "Standard Ketogenic",
+                     "children": [{"name": "High fat"}, {"name": "Low carb"}, {"name": "Moderate protein"}]},
+                    {"name": "Targeted Ketogenic",
+                     "children": [{"name": "Carbs around workouts"}, {"name": "High fat"}]},
+                ],
+            },
+            {
+                "name": "Paleo",
+                "children": [
+                    {"name": "Primal", "children": [{"name": "Includes dairy"}, {"name": "Grain-free"}]},
+                    {"name": "Autoimmune Paleo",
+                     "children": [{"name": "Avoids inflammatory foods"}, {"name": "Focus on nutrient density"}]},
+                ],
+            },
+            # Add more diet types and subcategories as needed
+            {
+                "name": "Fast Food Diet",
+                "children": [
+                    {"name": "Convenience-focused",
+                     "children": [{"name": "Readily available meals"}, {"name": "Includes processed foods"}]},
+                    {"name": "Snack-oriented",
+                     "children": [{"name": "High in snacks"}, {"name": "Low in whole foods"}]},
+                ],
+            },
+            {
+                "name": "Junk Food Diet",
+                "children": [
+                    {"name": "High Sugar",
+                     "children": [{"name": "Soda and candies"}, {"name": "Processed sweet snacks"}]},
+                    {"name": "High Fat", "children": [{"name": "Fried foods"}, {"name": "Processed meat products"}]},
+                ],
+            },
+            {
+                "name": "Gluten-Free Diet",
+                "children": [
+                    {"name": "Celiac-friendly",
+                     "children": [{"name": "Strictly no gluten"}, {"name": "Focus on gluten-free grains"}]},
+                    {"name": "Non-Celiac Gluten Sensitivity",
+                     "children": [{"name": "Reduced gluten intake"}, {"name": "Emphasis on whole foods"}]},
+                ],
+            },
+            {
+                "name": "Low Carb Diet",
+                "children": [
+                    {"name": "Atkins Diet",
+                     "children": [{"name": "Phases of carb intake"}, {"name": "High protein and fat"}]},
+                    {"name": "South Beach Diet",
+                     "children": [{"name": "Low glycemic index foods"}, {"name": "Phased approach to carbs"}]},
+                ],
+            },
+            {
+                "name": "Mediterranean Diet",
+                "children": [
+                    {"name": "Heart-healthy", "children": [{"name": "Rich in fruits and vegetables"},
+                                                           {"name": "Includes whole grains and lean proteins"}]},
+                    {"name": "Wine-inclusive",
+                     "children": [{"name": "Moderate wine consumption"}, {"name": "Balanced diet with healthy fats"}]},
+                ],
+            },
+        ],
+    }
+
+
+@page('HOMEPAGE', icon='house', needs=['survey', 'frame'])
+def homepage(survey, frame):
+    st.title('Welcome to MealMetrics!')
+
+    # Banner Image
+    # st.image('homepage_banner.jpg', use_column_width=True)
+
+    # Introduction and Description
+    st.markdown("""
+    ## 🥗 MealMetrics: Your Dietary Insight Tool
+    MealMetrics is a webapp designed to analyze and visualize dietary habits based on user-submitted data. 
+    The data is collected from various sources and is used to provide insights into dietary patterns, preferences, and nutrition considerations.
+
+    - **Data Collection:** Through online surveys focusing on dietary habits, meal frequency, nutritional considerations, and more.
+    - **Purpose:** To help users understand eating habits and make informed decisions about their diet and nutrition.
+    - **Data Description:** Metrics like meal frequency, dietary preferences, nutritional value, etc., from diverse individuals.
+    """)
+
+    # Interactive Data Preview Section
+    st.subheader('🔍 Preview of Collected Data')
+    # Display one page of the data at a time; sorting and filtering happen on
+    # the server and only the rows on the page are sent to the browser
+    from preview import PAGE_SIZES, filter_mask, preview_columns, preview_page, preview_rows, sort_order
+
+    # In streaming mode only the first rows of the sheet are kept for the preview
+    if survey.rows > len(frame):
+        st.info(f'Previewing the first {len(frame)} of {survey.rows} responses')
+
+    columns = preview_columns(frame)
+    filterable = [column for column in columns if frame[column].dtype == 'category']
+    col1, col2, col3, col4, col5 = st.columns([2, 1, 2, 3, 1])
+    sort_by = col1.selectbox('Sort by', ['Response order'] + columns)
+    descending = col2.checkbox('Descending')
+    filter_by = col3.selectbox('Filter by', ['No filter'] + filterable)
+    filter_values = col4.multiselect('Show only', [] if filter_by == 'No filter' else list(frame[filter_by].cat.categories))
+    page_size = col5.selectbox('Rows per page', PAGE_SIZES)
+
+    # Sort orders are computed once per data version and shared by every session
+    order = None
+    if sort_by != 'Response order':
+        order = survey.artifact(('sort', sort_by, descending), lambda data: sort_order(data, sort_by, not descending))
+    mask = filter_mask(frame, filter_by, filter_values) if filter_values else None
+    rows = preview_rows(order, mask)
+
+    total = len(frame) if rows is None else len(rows)
+    pages = max((total + page_size - 1) // page_size, 1)
+    page_number = st.number_input('Page', min_value=1, max_value=pages, value=1)
+    st.dataframe(preview_page(frame, columns, rows, page_number - 1, page_size), use_container_width=True)
+    st.caption(f'Page {page_number} of {pages} · {total} responses')
+
+    # Detailed Data Description
+    st.markdown("""
+    ### 📊 Detailed Data Description
+
+    - **Gender:** The gender of the respondent.
+    - **Dietary Preferences:** Choices like vegetarian, vegan, keto, etc.
+    - **Meal Frequency:** Number of meals eaten in a day.
+    - **Nutritional Consideration:** Focus on nutritional info when choosing food.
+    - **Fruits and Vegetables Consumption:** Frequency of consumption.
+    - **Whole Grains Consumption:** Inclusion of whole grains in meals.
+    - **Snacking Habits:** Information about snacking between meals.
+    - **Eating Out Frequency:** How often eating out occurs weekly.
+    - **Food Label Reading Habits:** Regular reading of food labels for nutrition.
+    - **Steps to Improve Diet:** Actions taken to improve diet.
+    - **Health Consciousness:** Measure of diet-related health awareness.
+    - **Food Selection Priorities:** Factors prioritized in food selection (taste, cost, health benefits).
+
+    This data helps create interactive visualizations for insights into dietary habits.
+    """)
+
+    # Visual Element: Interactive Charts or Graphs
+    st.subheader('📈 Interactive Diet Insights')
+    # Example: Display an interactive chart based on the data
+    # st.plotly_chart(some_plotly_chart_based_on_data)
+
+    # Footer
+    st.markdown("---")
+    st.markdown("© 2023 MealMetrics - Unveiling Dietary Patterns")
+
+
+@page('PANEL', icon='map', needs=['panel_cube', 'panel_associations', 'food_tree', 'diet_tree'])
+def panel(panel_cube, panel_associations, food_tree, diet_tree):
+    # Every chart below is drawn from the responses matching the sidebar filters
+    cube = panel_cube
+    with startup_timer('streamlit_echarts'):
+        from streamlit_echarts import st_echarts
+    with startup_timer('figures (matplotlib, seaborn)'):
+        from figures import countplot_image
+    from associations import contingency
+    st_echarts = timed('echarts.render', st_echarts)
+
+    st.title('📊 Dashboard')
+    st.markdown('''
+        This dashboard presents a visual analysis of dietary habits, offering insights into the balance between healthy and junk food choices.
+        ''')
+
+    # Banner Image for Dashboard
+    # st.image('dashboard_banner.jpg', use_column_width=True)
+
+    # Sunburst Chart for Healthy vs Junk Food
+    st.subheader('🍏 Healthy Food vs Junk Food 🍔')
+    st.markdown('Explore the comparative overview of healthy and junk food items:')
+
     # The sunburst chart option
     option = {
         "title": {
@@ -193,7 +409,7 @@ if selected_page == 'PANEL':
         },
         "series": {
             "type": "sunburst",
-            "data": food_data,
+            "data": food_tree,
             "radius": [0, "95%"],
             "sort": None,
             "emphasis": {"focus": "ancestor"},
@@ -225,74 +441,50 @@ if selected_page == 'PANEL':
     # Creating three columns for additional visualizations
     st.subheader('🔍 In-Depth Dietary Analysis')
 
+    # Every chart below reads from the aggregates computed once per data version,
+    # and the countplots are served from images rendered once per set of counts
+
     # Creating three columns for the visualizations
     col1, col2, col3 = st.columns(3)
 
     # Visualization 1: Nutritional Value Consideration
     with col1:
         st.write('Nutritional Value Consideration')
-        fig, ax = plt.subplots()
-        sns.countplot(x='Nutritional Consideration', data=data, palette='viridis')
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
+        st.image(countplot_image(cube['counts']['Nutritional Consideration'], 'viridis'), use_column_width=True)
 
         # Visualization 1: Meal Frequency
         st.write('Dietary Preferences')
-        fig, ax = plt.subplots()
-        sns.countplot(x='Dietary Preferences', data=data, palette='tab10')
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
+        st.image(countplot_image(cube['counts']['Dietary Preferences'], 'tab10'), use_column_width=True)
 
         # Visualization 1: Meal Frequency
         st.write('Eating Out Frequency')
-        fig, ax = plt.subplots()
-        sns.countplot(x='Eating Out Frequency', data=data, palette='viridis')
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
+        st.image(countplot_image(cube['counts']['Eating Out Frequency'], 'viridis'), use_column_width=True)
 
     # Visualization 2: Food Label Reading Habits
     with col2:
         st.write('Food Label Reading Habits')
-        fig, ax = plt.subplots()
-        sns.countplot(x='Food Label Reading Habits', data=data, palette='tab10')
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
+        st.image(countplot_image(cube['counts']['Food Label Reading Habits'], 'tab10'), use_column_width=True)
 
         # Visualization 1: Meal Frequency
         st.write('Fruits and Vegetables Consumption')
-        fig, ax = plt.subplots()
-        sns.countplot(x='Fruits and Vegetables Consumption', data=data, palette='viridis')
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
+        st.image(countplot_image(cube['counts']['Fruits and Vegetables Consumption'], 'viridis'), use_column_width=True)
 
         # Visualization 1: Meal Frequency
         st.write('Snacking Habits')
-        fig, ax = plt.subplots()
-        sns.countplot(x='Snacking Habits', data=data, palette='tab10')
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
+        st.image(countplot_image(cube['counts']['Snacking Habits'], 'tab10'), use_column_width=True)
 
     # Visualization 3: Meal Frequency
     with col3:
         st.write('Meal Frequency')
-        fig, ax = plt.subplots()
-        sns.countplot(x='Meal Frequency', data=data, palette='viridis')
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
+        st.image(countplot_image(cube['counts']['Meal Frequency'], 'viridis'), use_column_width=True)
 
         # Visualization 1: Meal Frequency
         st.write('Whole Grains Consumption')
-        fig, ax = plt.subplots()
-        sns.countplot(x='Whole Grains Consumption', data=data, palette='tab10')
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
+        st.image(countplot_image(cube['counts']['Whole Grains Consumption'], 'tab10'), use_column_width=True)
 
         # Visualization 1: Meal Frequency
         st.write('Food Preference')
-        fig, ax = plt.subplots()
-        sns.countplot(x='Food Preference', data=data, palette='viridis')
-        plt.xticks(rotation=45)
-        st.pyplot(fig)
+        st.image(countplot_image(cube['counts']['Food Preference'], 'viridis'), use_column_width=True)
 
     # Adding a Divider
     st.markdown('---')
@@ -300,12 +492,11 @@ if selected_page == 'PANEL':
     # Health Consciousness and Food Selection Priorities Analysis
     st.subheader('📈 Health Consciousness & Food Selection Priorities')
 
-    # Calculate category frequencies for 'Health Consciousness'
-    category_counts_health = data['Health Consciousness'].value_counts().reset_index()
-    category_counts_health.columns = ['Category', 'Count']
-    xAxis_data_health = category_counts_health['Category'].tolist()
+    # Category frequencies for 'Health Consciousness'
+    category_counts_health = cube['counts']['Health Consciousness']
+    xAxis_data_health = category_counts_health.index.tolist()
     series_data_health = [{"value": count, "name": category} for category, count in
-                          zip(xAxis_data_health, category_counts_health['Count'])]
+                          zip(xAxis_data_health, category_counts_health.tolist())]
 
     # Options for 'Health Consciousness' bar chart
     options_health = {
@@ -317,13 +508,11 @@ if selected_page == 'PANEL':
         "series": [{"data": series_data_health, "type": "bar"}],
     }
 
-    # Processing the 'Food Selection Priorities' column
-    priorities_data = data['Food Selection Priorities'].str.get_dummies(sep=', ')
-    priorities_counts = priorities_data.sum().reset_index()
-    priorities_counts.columns = ['Category', 'Count']
-    xAxis_data_priorities = priorities_counts['Category'].tolist()
+    # Option counts of the 'Food Selection Priorities' column
+    priorities_counts = cube['priorities']
+    xAxis_data_priorities = priorities_counts.index.tolist()
     series_data_priorities = [{"value": count, "name": category} for category, count in
-                              zip(xAxis_data_priorities, priorities_counts['Count'])]
+                              zip(xAxis_data_priorities, priorities_counts.tolist())]
 
     # Options for 'Food Selection Priorities' bar chart
     options_priorities = {
@@ -347,13 +536,54 @@ if selected_page == 'PANEL':
     # Adding a Divider
     st.markdown('---')
 
+    # Healthy choices per group, from the indicator counts kept in the cube
+    st.subheader('💪 Healthy Choices by Group')
+    if cube['healthy_by']:
+        segment = st.selectbox('Compare healthy choices by', list(cube['healthy_by']))
+        healthy_by = cube['healthy_by'][segment]
+        respondents = cube['counts'][segment].reindex(healthy_by.index)
+        rates = healthy_by.div(respondents.where(respondents > 0), axis=0).mul(100).round(1).fillna(0)
+
+        # Options for the healthy choices bar chart
+        options_healthy = {
+            "title": {"text": "Healthy Choices", "subtext": f"Percentage of respondents per {segment}",
+                      "left": "center"},
+            "tooltip": {"trigger": "axis", "axisPointer": {"type": "shadow"}},
+            "legend": {"top": "bottom"},
+            "xAxis": {"type": "category", "data": rates.columns.tolist(), "axisLabel": {"rotate": 25, "interval": 0}},
+            "yAxis": {"type": "value", "max": 100},
+            "series": [{"name": str(answer), "type": "bar", "data": rates.loc[answer].tolist()}
+                       for answer in rates.index],
+        }
+
+        # Options for the health score distribution
+        health_scores = cube['health_scores']
+        options_scores = {
+            "title": {"text": "Health Score", "subtext": "Healthy habits per respondent", "left": "center"},
+            "tooltip": {"trigger": "axis", "axisPointer": {"type": "shadow"}},
+            "xAxis": {"type": "category", "data": [str(score) for score in health_scores.index]},
+            "yAxis": {"type": "value"},
+            "series": [{"data": health_scores.tolist(), "type": "bar"}],
+        }
+
+        col1, col2 = st.columns([2, 1])
+
+        with col1:
+            st_echarts(options=options_healthy, height="550px")
+
+        with col2:
+            st_echarts(options=options_scores, height="550px")
+
+    # Adding a Divider
+    st.markdown('---')
+
     # Whole Grains Consumption and Steps to Improve Diet Analysis
     st.subheader('🥗 Diet Improvement & Whole Grains Analysis')
 
     # Pie Chart for 'Whole Grains Consumption'
-    category_counts_whole_grains = data['Whole Grains Consumption'].value_counts().reset_index()
-    category_counts_whole_grains.columns = ['name', 'value']
-    chart_data_whole_grains = category_counts_whole_grains.to_dict(orient='records')
+    category_counts_whole_grains = cube['counts']['Whole Grains Consumption']
+    chart_data_whole_grains = [{"name": name, "value": value} for name, value in
+                               zip(category_counts_whole_grains.index, category_counts_whole_grains.tolist())]
 
     # Options for 'Whole Grains Consumption' pie chart
     options_pie_whole_grains = {
@@ -382,9 +612,9 @@ if selected_page == 'PANEL':
     }
 
     # Pie Chart for 'Steps to Improve Diet'
-    category_counts_improve_diet = data['Steps to Improve Diet'].value_counts().reset_index()
-    category_counts_improve_diet.columns = ['name', 'value']
-    chart_data_improve_diet = category_counts_improve_diet.to_dict(orient='records')
+    category_counts_improve_diet = cube['counts']['Steps to Improve Diet']
+    chart_data_improve_diet = [{"name": name, "value": value} for name, value in
+                               zip(category_counts_improve_diet.index, category_counts_improve_diet.tolist())]
 
     # Options for 'Steps to Improve Diet' pie chart
     options_pie_improve_diet = {
@@ -428,106 +658,58 @@ if selected_page == 'PANEL':
     # Adding a Divider
     st.markdown('---')
 
-    # Diet Types Tree Chart
-    st.subheader('🌱 Diet Types Overview')
-    st.markdown('An interactive exploration of various diet types and their characteristics:')
-
-    diet_data = {
-        "name": "Diet Types",
-        "children": [
-            {
-                "name": "Vegetarian",
-                "children": [
-                    {"name": "Lacto-vegetarian",
-                     "children": [{"name": "Dairy products included"}, {"name": "No eggs or meat"}]},
-                    {"name": "Ovo-vegetarian", "children": [{"name": "Eggs included"}, {"name": "No dairy or meat"}]},
-                    {"name": "Lacto-ovo vegetarian",
-                     "children": [{"name": "Includes dairy and eggs"}, {"name": "No meat"}]},
-                    {"name": "Flexitarian",
-                     "children": [{"name": "Primarily vegetarian"}, {"name": "Occasional meat consumption"}]},
-                ],
-            },
-            {
-                "name": "Vegan",
-                "children": [
-                    {"name": "Raw vegan",
-                     "children": [{"name": "Only uncooked foods"}, {"name": "No animal products"}]},
-                    {"name": "Whole-food vegan",
-                     "children": [{"name": "Whole plant foods"}, {"name": "Minimally processed"}]},
-                ],
-            },
-            {
-                "name": "Pescatarian",
-                "children": [
-                    {"name": "Mediterranean",
-                     "children": [{"name": "Fish and seafood"}, {"name": "Plant-based with olive oil"}]},
-                    {"name": "Nordic", "children": [{"name": "Seafood-rich"}, {"name": "Includes root vegetables"}]},
-                ],
-            },
-            {
-                "name": "Ketogenic",
-                "children": [
-                    {"name": "Standard Ketogenic",
-                     "children": [{"name": "High fat"}, {"name": "Low carb"}, {"name": "Moderate protein"}]},
-                    {"name": "Targeted Ketogenic",
-                     "children": [{"name": "Carbs around workouts"}, {"name": "High fat"}]},
-                ],
-            },
-            {
-                "name": "Paleo",
-                "children": [
-                    {"name": "Primal", "children": [{"name": "Includes dairy"}, {"name": "Grain-free"}]},
-                    {"name": "Autoimmune Paleo",
-                     "children": [{"name": "Avoids inflammatory foods"}, {"name": "Focus on nutrient density"}]},
-                ],
-            },
-            # Add more diet types and subcategories as needed
-            {
-                "name": "Fast Food Diet",
-                "children": [
-                    {"name": "Convenience-focused",
-                     "children": [{"name": "Readily available meals"}, {"name": "Includes processed foods"}]},
-                    {"name": "Snack-oriented",
-                     "children": [{"name": "High in snacks"}, {"name": "Low in whole foods"}]},
-                ],
-            },
-            {
-                "name": "Junk Food Diet",
-                "children": [
-                    {"name": "High Sugar",
-                     "children": [{"name": "Soda and candies"}, {"name": "Processed sweet snacks"}]},
-                    {"name": "High Fat", "children": [{"name": "Fried foods"}, {"name": "Processed meat products"}]},
-                ],
-            },
-            {
-                "name": "Gluten-Free Diet",
-                "children": [
-                    {"name": "Celiac-friendly",
-                     "children": [{"name": "Strictly no gluten"}, {"name": "Focus on gluten-free grains"}]},
-                    {"name": "Non-Celiac Gluten Sensitivity",
-                     "children": [{"name": "Reduced gluten intake"}, {"name": "Emphasis on whole foods"}]},
-                ],
-            },
-            {
-                "name": "Low Carb Diet",
-                "children": [
-                    {"name": "Atkins Diet",
-                     "children": [{"name": "Phases of carb intake"}, {"name": "High protein and fat"}]},
-                    {"name": "South Beach Diet",
-                     "children": [{"name": "Low glycemic index foods"}, {"name": "Phased approach to carbs"}]},
-                ],
-            },
+    # Heatmap of the association between every two survey questions
+    st.subheader('🔗 Which Habits Go Together')
+    st.markdown("How strongly the answers to one question depend on the answers to another, as Cramér's V "
+                "from 0 (unrelated) to 1 (one answer gives the other away):")
+    strength = panel_associations['cramers_v']
+    questions = strength.columns.tolist()
+    # The diagonal, a question against itself, is left blank so it doesn't set the scale
+    cells = [[j, i, '-' if i == j else round(float(strength.iat[i, j]), 3)]
+             for i in range(len(questions)) for j in range(len(questions))]
+    pairs = panel_associations['pairs']
+    option = {
+        "tooltip": {"position": "top"},
+        "grid": {"left": 220, "right": 30, "top": 10, "bottom": 220},
+        "xAxis": {"type": "category", "data": questions, "axisLabel": {"rotate": 45, "interval": 0}},
+        "yAxis": {"type": "category", "data": questions, "axisLabel": {"interval": 0}},
+        "visualMap": {
+            "min": 0,
+            "max": round(float(pairs['cramers_v'].max()), 3) if len(pairs) else 1,
+            "calculable": True,
+            "orient": "horizontal",
+            "left": "center",
+            "bottom": 0,
+        },
+        "series": [
             {
-                "name": "Mediterranean Diet",
-                "children": [
-                    {"name": "Heart-healthy", "children": [{"name": "Rich in fruits and vegetables"},
-                                                           {"name": "Includes whole grains and lean proteins"}]},
-                    {"name": "Wine-inclusive",
-                     "children": [{"name": "Moderate wine consumption"}, {"name": "Balanced diet with healthy fats"}]},
-                ],
-            },
+                "name": "Cramér's V",
+                "type": "heatmap",
+                "data": cells,
+                "label": {"show": len(questions) <= 15, "fontSize": 9},
+                "emphasis": {"itemStyle": {"shadowBlur": 10, "shadowColor": "rgba(0, 0, 0, 0.5)"}},
+            }
         ],
     }
+    st_echarts(option, height=f"{max(500, 40 * len(questions) + 230)}px")
+
+    # Strongest pairs, and the contingency table of any pair
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown('**Strongest associations**')
+        st.dataframe(pairs.head(10).rename(columns={
+            'column': 'Question', 'other': 'Other question', 'chi2': 'Chi-square', 'dof': 'Degrees of freedom',
+            'cramers_v': "Cramér's V", 'respondents': 'Respondents'}).round(3), hide_index=True)
+    with col2:
+        if len(questions) >= 2:
+            first = st.selectbox('Question', questions, key='association first')
+            second = st.selectbox('Compared with', [question for question in questions if question != first],
+                                  key='association second')
+            st.dataframe(contingency(panel_associations['counts'], first, second))
+
+    # Diet Types Tree Chart
+    st.subheader('🌱 Diet Types Overview')
+    st.markdown('An interactive exploration of various diet types and their characteristics:')
 
     # The tree chart option
     option = {
@@ -535,7 +717,7 @@ if selected_page == 'PANEL':
         "series": [
             {
                 "type": "tree",
-                "data": [diet_data],
+                "data": [diet_tree],
                 "top": "1%",
                 "left": "7%",
                 "bottom": "1%",
@@ -569,7 +751,82 @@ if selected_page == 'PANEL':
     st.markdown("---")
     st.markdown("© 2023 MealMetrics - Unveiling Nutritional Insights")
 
-if selected_page == 'ABOUT':
+
+# Options of an echarts line chart with one line per column of `table`
+def line_options(title, subtext, labels, table, y_max=None):
+    options = {
+        "title": {"text": title, "subtext": subtext, "left": "center"},
+        "tooltip": {"trigger": "axis"},
+        "legend": {"type": "scroll", "bottom": 0},
+        "grid": {"bottom": 100},
+        "xAxis": {"type": "category", "data": labels},
+        "yAxis": {"type": "value"},
+        "dataZoom": [{"type": "inside"}, {"type": "slider", "bottom": 35}],
+        "series": [{"name": str(name), "type": "line", "showSymbol": False, "data": values.round(1).tolist()}
+                   for name, values in table.items()],
+    }
+    if y_max is not None:
+        options["yAxis"]["max"] = y_max
+    return options
+
+
+@page('TRENDS', icon='graph-up', needs=['trends'])
+def trends_page(trends):
+    with startup_timer('streamlit_echarts'):
+        from streamlit_echarts import st_echarts
+    from survey_schema import PRIORITIES
+    from trends import FREQUENCIES, resample_trends, rolling_trends, shares
+    st_echarts = timed('echarts.render', st_echarts)
+
+    st.title('📈 Trends')
+    st.markdown('How dietary habits shift over time, by the day each response was submitted.')
+    if trends is None or not len(trends['responses']):
+        st.info('The responses have no submission timestamps to chart yet.')
+        return
+
+    # Daily counts are kept per data version; buckets and rolling windows are
+    # derived from them on every rerun, which only touches one row per day
+    col1, col2, col3 = st.columns(3)
+    bucket = col1.selectbox('Group responses by', list(FREQUENCIES))
+    window = col2.slider('Rolling window (days)', 1, 90, 7, disabled=bucket != 'Daily',
+                         help='Each day shows the responses of the last days in the window')
+    percent = col3.checkbox('Show percentages of responses', value=True)
+    if bucket == 'Daily' and window > 1:
+        view, period = rolling_trends(trends, window), f'{window}-day rolling window'
+    else:
+        view, period = resample_trends(trends, FREQUENCIES[bucket]), bucket.lower()
+    labels = [day.strftime('%Y-%m' if bucket == 'Monthly' else '%Y-%m-%d') for day in view['responses'].index]
+    responses = view['responses']
+    if trends['undated']:
+        st.caption(f"{trends['undated']} responses without a readable timestamp are left out")
+
+    # Responses and the average health score over time
+    scores = (view['scores'] / responses.where(responses > 0)).fillna(0)
+    col1, col2 = st.columns(2)
+    with col1:
+        st_echarts(options=line_options('Responses', period.capitalize(), labels, responses.rename('Responses').to_frame()),
+                   height="450px")
+    with col2:
+        st_echarts(options=line_options('Average Health Score', 'Healthy habits per respondent', labels,
+                                        scores.rename('Health Score').to_frame()), height="450px")
+
+    # Healthy habit indicators over time
+    st.subheader('💪 Healthy Habits over Time')
+    healthy = shares(view['healthy'], responses) if percent else view['healthy']
+    st_echarts(options=line_options('Healthy Choices', 'Percentage of respondents' if percent else 'Respondents',
+                                    labels, healthy, 100 if percent else None), height="500px")
+
+    # Answers of any survey column over time
+    st.subheader('🔍 Answers over Time')
+    column = st.selectbox('Survey question', list(view['answers']) + [PRIORITIES])
+    answers = view['priorities'] if column == PRIORITIES else view['answers'][column]
+    answers = shares(answers, responses) if percent else answers
+    st_echarts(options=line_options(column, 'Percentage of respondents' if percent else 'Respondents', labels,
+                                    answers, 100 if percent else None), height="500px")
+
+
+@page('ABOUT', icon='info-circle')
+def about():
     st.title('🌟 About Us')
 
     # Banner Image for About Page
@@ -619,8 +876,10 @@ if selected_page == 'ABOUT':
     st.markdown("---")
     st.markdown("© 2023 MealMetrics - Pioneering Nutritional Insights")
 
+
 # Contact Us page
-if selected_page == 'CONTACT':
+@page('CONTACT', icon='envelope')
+def contact():
     st.title('📞 Contact Us')
 
     # Use columns for a structured layout
@@ -664,3 +923,45 @@ if selected_page == 'CONTACT':
     # Footer
     st.markdown("---")
     st.markdown("© 2023 MealMetrics - Pioneering Nutritional Insights")
+
+
+# Add on_change callback
+def on_change(key):
+    selection = st.session_state[key]
+
+
+selected_page = option_menu(None, page_names(),
+                            icons=page_icons(),
+                            on_change=on_change, key='menu', orientation="horizontal",
+                            styles={
+                                "container": {"padding": "4px", "background-color": "#f0f0f0", "border-radius": "10px", "width": "100%"},  # Set the container width to 100%
+                                "icon": {"color": "#606060", "font-size": "18px"},  # Increase the font size for icons
+                                "nav-link": {"font-size": "18px", "text-align": "center", "margin": "0px", "color": "#505050", "font-weight": "normal"},  # Increase font size for text
+                                "nav-link-selected": {"background-color": "#B0A4E6", "color": "black", "font-weight": "normal"},  # Darker shade of light violet and normal font weight
+                            })
+
+# Page layouts
+render(selected_page)
+
+# Startup timings: worker start to first paint, and the lazy imports above
+mark_first_paint()
+rerun = end_rerun(selected_page)
+if STARTUP_REPORT:
+    with st.sidebar.expander('⏱️ Startup report'):
+        for name, seconds in startup_report().items():
+            st.write(f'{name}: {seconds * 1000:.0f} ms')
+        st.write(f'this rerun: {(time.perf_counter() - RERUN_START) * 1000:.0f} ms')
+
+# Where the time of this rerun went, and the latency percentiles of the process
+if DEBUG_PANEL:
+    with st.sidebar.expander(f'🐞 This rerun: {rerun["ms"]:.0f} ms', expanded=True):
+        for entry in rerun['spans']:
+            label = entry.get('page') or entry.get('provider') or entry.get('artifact') or entry.get('chart') or ''
+            rows = f' · {entry["rows"]} rows' if 'rows' in entry else ''
+            st.text(f'{"  " * entry["depth"]}{entry["span"]} {label} {entry["ms"]:.1f} ms{rows}')
+        for name, value in sorted(rerun['counters'].items()):
+            st.text(f'{name}: {value}')
+    with st.sidebar.expander('🐞 Latency percentiles (ms)'):
+        st.dataframe([{'span': ' '.join([span['span'], *map(str, span['labels'].values())]), 'count': span['count'],
+                       'p50': span['p50'] * 1000, 'p90': span['p90'] * 1000, 'p99': span['p99'] * 1000}
+                      for span in metrics.summary()], hide_index=True)
@@ -1,148 +1,250 @@
-import gspread 
-from oauth2client.service_account import ServiceAccountCredentials
+import argparse
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
 import pandas as pd
-import matplotlib.pyplot as plt
 import seaborn as sns
 import plotly.graph_objects as go
+from matplotlib.figure import Figure
 from plotly.subplots import make_subplots
 
-# Define the scope
-scope = ["https://spreadsheets.google.com/feeds",'https://www.googleapis.com/auth/spreadsheets',"https://www.googleapis.com/auth/drive.file","https://www.googleapis.com/auth/drive"]
-
-# Add credentials to the account
-creds = ServiceAccountCredentials.from_json_keyfile_name('proven-yen-409211-2ee88f35110a.json', scope)
-
-# Authorize the clientsheet 
-client = gspread.authorize(creds)
-
-# Open the spreadsheet
-sheet = client.open('mealmetrics_data').sheet1
-
-# Get the data
-data_ = sheet.get_all_records()
-
-# Convert to DataFrame
-data = pd.DataFrame(data_)
+from figures import plot_counts
 
 # Setting a diverse color palette for visualization
 sns.set_palette("tab10")
 
-# Creating different types of charts for various columns in the dataset
-plt.figure(figsize=(15, 24))
-
-# 1. Nutritional Value Consideration
-plt.subplot(4, 2, 1)
-sns.countplot(x='Nutritional Consideration', data=data)
-plt.title('Nutritional Value Consideration')
-plt.xticks(rotation=45)
-
-# 2. Reading Food Labels for Nutritional Information
-plt.subplot(4, 2, 2)
-sns.countplot(x='Food Label Reading Habits', data=data)
-plt.title('Reading Food Labels for Nutritional Information')
-plt.xticks(rotation=45)
-
-# 3. Meal Frequency
-plt.subplot(4, 2, 3)
-sns.countplot(x='Meal Frequency', data=data)
-plt.title('Meal Frequency')
-plt.xticks(rotation=45)
-
-# 4. Diet Plan Following
-plt.subplot(4, 2, 4)
-sns.countplot(x='Dietary Preferences', data=data)
-plt.title('Diet Plan Following')
-plt.xticks(rotation=45)
-
-# 5. Fruits and Vegetables in Diet
-plt.subplot(4, 2, 5)
-sns.countplot(x='Fruits and Vegetables Consumption', data=data)
-plt.title('Fruits and Vegetables in Diet')
-plt.xticks(rotation=45)
-
-# 6. Whole Grains Consumption
-plt.subplot(4, 2, 6)
-sns.countplot(x='Whole Grains Consumption', data=data)
-plt.title('Whole Grains Consumption')
-plt.xticks(rotation=45)
-
-# 7. Eating Out Frequency
-plt.subplot(4, 2, 7)
-sns.countplot(x='Eating Out Frequency', data=data)
-plt.title('Eating Out Frequency')
-plt.xticks(rotation=45)
-
-# 8. Snacking Between Meals
-plt.subplot(4, 2, 8)
-sns.countplot(x='Snacking Habits', data=data)
-plt.title('Snacking Between Meals')
-plt.xticks(rotation=45)
-
-plt.tight_layout()
-
-# Since the "top priorities" column contains multiple choices, we need to preprocess this data
-priorities_data = data['Food Selection Priorities'].str.get_dummies(sep=', ')
-priorities_counts = priorities_data.sum().sort_values(ascending=False)
-
-plt.figure(figsize=(12, 8))
-priorities_counts.plot(kind='bar', color=sns.color_palette("tab10"))
-plt.title('Top Priorities When Selecting Food')
-plt.xlabel('Priorities')
-plt.ylabel('Number of Responses')
-plt.xticks(rotation=45)
-
-# Creating a chart for the responses to "Are you currently taking any steps to improve your dietary habits?"
-steps_to_improve_diet_counts = data['Steps to Improve Diet'].value_counts()
-
-plt.figure(figsize=(8, 8))
-steps_to_improve_diet_counts.plot(kind='pie', autopct='%1.1f%%', startangle=140, colors=sns.color_palette("tab10"))
-plt.title('Steps to Improve Dietary Habits')
-plt.ylabel('')
-
-# Analyzing indicators of healthy habits
-indicators = {
-    "Nutritional Value Consideration": data['Nutritional Consideration'].isin(['Always', 'Often']).sum(),
-    "Read Food Labels": data['Food Label Reading Habits'].isin(['Always', 'Often']).sum(),
-    "Follow Diet Plan": data['Dietary Preferences'].ne('No specific diet').sum(),
-    "High Fruits & Vegetables": data['Fruits and Vegetables Consumption'].isin(['51% - 75%', 'More than 75%']).sum(),
-    "Frequent Whole Grains": data['Whole Grains Consumption'].isin(['Every meal', 'Most meals']).sum(),
-    "Taking Steps to Improve Diet": data['Steps to Improve Diet'].eq('Yes').sum()
-}
-
-total_respondents = len(data)
-healthy_choices_percentage = {key: (value / total_respondents * 100) for key, value in indicators.items()}
+# Every chart below is drawn from the cube of data_loader.load_cube(): answer
+# counts, per-gender breakdowns and healthy habit counts. Each chart is its own
+# function taking the cube and `new_figure` (pyplot's plt.figure when shown
+# interactively, a bare matplotlib Figure when rendered to files), so the batch
+# mode can draw them independently of each other.
 
-healthy_choices_df = pd.DataFrame(list(healthy_choices_percentage.items()), columns=['Indicator', 'Percentage'])
 
-plt.figure(figsize=(10, 6))
-sns.barplot(x='Percentage', y='Indicator', data=healthy_choices_df, palette="viridis")
-plt.title('Percentage of Respondents Showing Healthier Choices')
-plt.xlabel('Percentage of Respondents')
-plt.ylabel('Health Indicators')
-plt.xlim(0, 100)
-plt.show()
+# Creating different types of charts for various columns in the dataset
+def answers_grid(cube, new_figure=Figure):
+    fig = new_figure(figsize=(15, 24))
+    charts = [
+        # 1. Nutritional Value Consideration
+        ('Nutritional Consideration', 'Nutritional Value Consideration'),
+        # 2. Reading Food Labels for Nutritional Information
+        ('Food Label Reading Habits', 'Reading Food Labels for Nutritional Information'),
+        # 3. Meal Frequency
+        ('Meal Frequency', 'Meal Frequency'),
+        # 4. Diet Plan Following
+        ('Dietary Preferences', 'Diet Plan Following'),
+        # 5. Fruits and Vegetables in Diet
+        ('Fruits and Vegetables Consumption', 'Fruits and Vegetables in Diet'),
+        # 6. Whole Grains Consumption
+        ('Whole Grains Consumption', 'Whole Grains Consumption'),
+        # 7. Eating Out Frequency
+        ('Eating Out Frequency', 'Eating Out Frequency'),
+        # 8. Snacking Between Meals
+        ('Snacking Habits', 'Snacking Between Meals'),
+    ]
+    for position, (column, title) in enumerate(charts, start=1):
+        ax = fig.add_subplot(4, 2, position)
+        plot_counts(cube['counts'][column], ax=ax)
+        ax.set_title(title)
+        ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    return fig
+
+
+# Since the "top priorities" column contains multiple choices, its options are
+# counted separately
+def priorities_chart(cube, new_figure=Figure):
+    priorities_counts = cube['priorities'].sort_values(ascending=False)
+
+    fig = new_figure(figsize=(12, 8))
+    ax = fig.add_subplot()
+    # Sheets without the question, or without answers yet, get an empty chart
+    if priorities_counts.empty:
+        ax.text(0.5, 0.5, 'No food selection priorities', ha='center', va='center', transform=ax.transAxes)
+    else:
+        priorities_counts.plot(kind='bar', color=sns.color_palette("tab10"), ax=ax)
+    ax.set_title('Top Priorities When Selecting Food')
+    ax.set_xlabel('Priorities')
+    ax.set_ylabel('Number of Responses')
+    ax.tick_params(axis='x', labelrotation=45)
+    return fig
 
-# Gender-based analysis using Plotly
-male_data = data[data['Gender'] == 'Male']
-female_data = data[data['Gender'] == 'Female']
 
-fig = make_subplots(
-    rows=4, cols=2,
-    subplot_titles=("Nutritional Value Consideration (Male)", "Nutritional Value Consideration (Female)",
-                    "Meal Frequency (Male)", "Meal Frequency (Female)",
-                    "Diet Plan Following (Male)", "Diet Plan Following (Female)",
-                    "Fruits and Vegetables in Diet (Male)", "Fruits and Vegetables in Diet (Female)")
-)
+# Creating a chart for the responses to "Are you currently taking any steps to improve your dietary habits?"
+def improve_diet_chart(cube, new_figure=Figure):
+    steps_to_improve_diet_counts = cube['counts']['Steps to Improve Diet']
 
-fig.add_trace(go.Bar(x=male_data['Nutritional Consideration'].value_counts().index,
-                     y=male_data['Nutritional Consideration'].value_counts(),
-                     name='Nutritional Value (Male)'), row=1, col=1)
+    fig = new_figure(figsize=(8, 8))
+    ax = fig.add_subplot()
+    steps_to_improve_diet_counts.plot(kind='pie', autopct='%1.1f%%', startangle=140,
+                                      colors=sns.color_palette("tab10"), ax=ax)
+    ax.set_title('Steps to Improve Dietary Habits')
+    ax.set_ylabel('')
+    return fig
 
-fig.add_trace(go.Bar(x=female_data['Nutritional Consideration'].value_counts().index,
-                     y=female_data['Nutritional Consideration'].value_counts(),
-                     name='Nutritional Value (Female)'), row=1, col=2)
 
-# ... (Add other traces following the same pattern for male and female data)
+# Analyzing indicators of healthy habits
+def healthy_choices_chart(cube, new_figure=Figure):
+    indicators = cube['healthy']
+
+    # A sheet with no responses yet shows every indicator at 0%
+    total_respondents = max(cube['rows'], 1)
+    healthy_choices_percentage = {key: (value / total_respondents * 100) for key, value in indicators.items()}
+
+    healthy_choices_df = pd.DataFrame(list(healthy_choices_percentage.items()), columns=['Indicator', 'Percentage'])
+
+    fig = new_figure(figsize=(10, 6))
+    ax = fig.add_subplot()
+    sns.barplot(x='Percentage', y='Indicator', data=healthy_choices_df, palette="viridis", ax=ax)
+    ax.set_title('Percentage of Respondents Showing Healthier Choices')
+    ax.set_xlabel('Percentage of Respondents')
+    ax.set_ylabel('Health Indicators')
+    ax.set_xlim(0, 100)
+    return fig
+
+
+# Columns compared across segments in the Plotly dashboard, with their titles
+DASHBOARD_COLUMNS = [
+    ('Nutritional Consideration', 'Nutritional Value Consideration'),
+    ('Meal Frequency', 'Meal Frequency'),
+    ('Dietary Preferences', 'Diet Plan Following'),
+    ('Fruits and Vegetables Consumption', 'Fruits and Vegetables in Diet'),
+]
+
+
+# Segment-based analysis using Plotly: one row per dashboard column and one
+# subplot per answer of the segment column (Male, Female, ... for Gender). The
+# traces come straight from the cube's breakdown of every column by the
+# segment, computed in a single pass over the data.
+def segment_dashboard(cube, segment='Gender', new_figure=None):
+    tables = cube['by'][segment]
+    charts = [(column, title) for column, title in DASHBOARD_COLUMNS if column in tables]
+    values = list(tables[charts[0][0]].columns) if charts else []
+
+    fig = make_subplots(rows=max(len(charts), 1), cols=max(len(values), 1),
+                        subplot_titles=[f'{title} ({value})' for _, title in charts for value in values])
+    for row, (column, title) in enumerate(charts, start=1):
+        table = tables[column]
+        for col, value in enumerate(values, start=1):
+            fig.add_trace(go.Bar(x=table.index, y=table[value], name=f'{title} ({value})'), row=row, col=col)
+
+    fig.update_layout(height=200 * max(len(charts), 1), showlegend=False,
+                      title_text=f"MealMetrics: {segment}-Based Analysis Dashboard")
+    return fig
+
+
+# File name of the dashboard of a segment, e.g. gender_dashboard
+def dashboard_name(segment):
+    return re.sub(r'\W+', '_', segment.lower()).strip('_') + '_dashboard'
+
+
+# Every figure of the report, by the file name it is saved under
+FIGURES = {
+    'answers': answers_grid,
+    'priorities': priorities_chart,
+    'improve_diet': improve_diet_chart,
+    'healthy_choices': healthy_choices_chart,
+    'gender_dashboard': segment_dashboard,
+}
 
-fig.update_layout(height=800, showlegend=False, title_text="MealMetrics: Gender-Based Analysis Dashboard")
-fig.show()
+# matplotlib figures are saved as images; plotly figures as interactive HTML,
+# and as images too when kaleido is installed
+IMAGE_FORMATS = ['png', 'svg', 'pdf']
+FORMATS = IMAGE_FORMATS + ['html']
+
+
+# Figures to draw: the named ones (all by default) plus a dashboard for every
+# extra segment column
+def report_figures(names=None, segments=()):
+    draws = {name: FIGURES[name] for name in names or FIGURES}
+    draws.update({dashboard_name(segment): partial(segment_dashboard, segment=segment) for segment in segments})
+    return draws
+
+
+# Draw one figure and write it to `out` in every requested format it supports.
+# Runs in a worker process in batch mode; returns the files written.
+def render_figure(name, draw, cube, out, formats, dpi=150):
+    fig = draw(cube)
+    paths = []
+    for fmt in formats:
+        path = os.path.join(out, f'{name}.{fmt}')
+        if isinstance(fig, Figure):
+            if fmt == 'html':
+                continue
+            fig.savefig(path, format=fmt, dpi=dpi, bbox_inches='tight')
+        elif fmt == 'html':
+            fig.write_html(path)
+        else:
+            try:
+                fig.write_image(path, format=fmt)
+            except (ImportError, ValueError):
+                continue
+        paths.append(path)
+    if isinstance(fig, Figure):
+        fig.clear()
+    return paths
+
+
+# Render every figure to files, `workers` figures at a time in separate
+# processes. The cube is loaded once here and sent to the workers.
+def render_report(cube, out, formats, workers=None, names=None, segments=()):
+    os.makedirs(out, exist_ok=True)
+    draws = report_figures(names, segments)
+    if workers == 1:
+        return {name: render_figure(name, draw, cube, out, formats) for name, draw in draws.items()}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {name: executor.submit(render_figure, name, draw, cube, out, formats)
+                   for name, draw in draws.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+# Show every figure in interactive windows, as the script always did
+def show_report(cube, segments=()):
+    import matplotlib.pyplot as plt
+
+    dashboards = []
+    for name, draw in report_figures(segments=segments).items():
+        if name.endswith('_dashboard'):
+            dashboards.append(draw)
+        else:
+            draw(cube, plt.figure)
+    plt.show()
+    for draw in dashboards:
+        draw(cube).show()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Chart the MealMetrics survey responses')
+    parser.add_argument('--batch', action='store_true',
+                        help='render every figure to files instead of showing them, without a display')
+    parser.add_argument('--out', default='report', help='output directory in batch mode')
+    parser.add_argument('--format', nargs='+', choices=FORMATS, default=['png', 'html'], dest='formats')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='figures rendered in parallel (default: one per CPU, 1 renders in this process)')
+    parser.add_argument('--figures', nargs='+', choices=list(FIGURES), help='only render these figures')
+    parser.add_argument('--segments', nargs='+', default=[],
+                        help='also draw the dashboard by these segment columns (any of MEALMETRICS_CUBE_SEGMENTS)')
+    args = parser.parse_args(argv)
+
+    if args.batch:
+        import matplotlib
+
+        matplotlib.use('Agg')
+
+    from data_loader import load_cube
+
+    cube = load_cube()
+    unknown = [segment for segment in args.segments if segment not in cube['by']]
+    if unknown:
+        parser.error(f'no breakdown by {", ".join(unknown)}; segments: {", ".join(cube["by"])}')
+    if not args.batch:
+        show_report(cube, args.segments)
+        return
+    for name, paths in render_report(cube, args.out, args.formats, args.workers, args.figures,
+                                     args.segments).items():
+        print(f'{name}: {", ".join(paths) or "no file in the requested formats"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from indicators import evaluate, indicator_counts, indicator_counts_by, score_counts
+from survey_schema import PRIORITIES_MASK, SOURCE, SURVEY_SCHEMA, categories_for, priority_options
+
+# Columns every survey column is also broken down by. Only Categorical columns
+# can segment the cube; any other name listed is skipped by build_cube().
+CUBE_SEGMENTS = os.environ.get('MEALMETRICS_CUBE_SEGMENTS', 'Gender,Dietary Preferences,Source').split(',')
+
+# Rows counted per block by breakdown(), bounding its scratch memory
+BREAKDOWN_BLOCK_ROWS = 1 << 18
+
+
+# Answer counts of a Categorical column, in category order, as one bincount
+# over the integer codes
+def column_counts(values):
+    codes = values.cat.codes.to_numpy()
+    counts = np.bincount(codes[codes >= 0], minlength=len(values.cat.categories))
+    return pd.Series(counts, index=values.cat.categories, name=values.name)
+
+
+# Answers of every column per answer of the segment column `by`, for all the
+# columns in one pass: every (segment answer, column, answer) triple owns one
+# slot of a single bincount. Returns {column: table}, each table with one row
+# per answer of the column and one column per answer of `by`.
+def breakdown(data, by, columns=None):
+    columns = [column for column in (columns or SURVEY_SCHEMA) if column in data.columns and column != by]
+    categories = [data[column].cat.categories for column in columns]
+    offsets = np.cumsum([0] + [len(answers) for answers in categories])
+    width = int(offsets[-1])
+    segments = data[by].cat.codes.to_numpy().astype(np.int64)
+    counts = np.zeros(len(data[by].cat.categories) * width, dtype=np.int64)
+    # A sheet with no responses yet has no answers at all: counts stay empty
+    for start in range(0, len(data) if width else 0, BREAKDOWN_BLOCK_ROWS):
+        block = slice(start, start + BREAKDOWN_BLOCK_ROWS)
+        codes = np.stack([data[column].cat.codes.to_numpy()[block] for column in columns], axis=1).astype(np.int64)
+        slots = segments[block, None] * width + offsets[:-1] + codes
+        counts += np.bincount(slots[(segments[block, None] >= 0) & (codes >= 0)], minlength=len(counts))
+    counts = counts.reshape(len(data[by].cat.categories), width)
+    return {column: pd.DataFrame(counts[:, offsets[i]:offsets[i + 1]].T, index=answers,
+                                 columns=data[by].cat.categories)
+            for i, (column, answers) in enumerate(zip(columns, categories))}
+
+
+# Respondents share a handful of distinct priority combinations, so the option
+# arithmetic runs on those: returns the combination of every respondent, and
+# one row of 0/1 option bits per distinct combination.
+def _priority_bits(data):
+    combos, masks = pd.factorize(data[PRIORITIES_MASK].to_numpy())
+    shifts = np.arange(len(priority_options(data)), dtype=np.uint64)
+    bits = (masks[:, None] >> shifts) & np.uint64(1)
+    return combos, bits.astype(np.int64)
+
+
+# How many respondents picked each food selection priority. Options nobody
+# picked are left out, as are all of them when the sheet has no priorities
+# question.
+def priority_counts(data):
+    if PRIORITIES_MASK not in data.columns:
+        return pd.Series(dtype=np.int64)
+    combos, bits = _priority_bits(data)
+    counts = np.bincount(combos, minlength=len(bits)) @ bits
+    counts = pd.Series(counts, index=priority_options(data))
+    return counts[counts > 0]
+
+
+# How many respondents picked both priorities, for every pair of options
+def priority_cooccurrence(data):
+    if PRIORITIES_MASK not in data.columns:
+        return pd.DataFrame(dtype=np.int64)
+    combos, bits = _priority_bits(data)
+    weighted = bits * np.bincount(combos, minlength=len(bits))[:, None]
+    options = priority_options(data)
+    return pd.DataFrame(bits.T @ weighted, index=options, columns=options)
+
+
+# Priority counts per answer of a Categorical segment column
+def priority_counts_by(data, segment):
+    if PRIORITIES_MASK not in data.columns:
+        return pd.DataFrame(index=data[segment].cat.categories, dtype=np.int64)
+    combos, bits = _priority_bits(data)
+    segments = data[segment].cat.codes.to_numpy().astype(np.int64)
+    answered = segments >= 0
+    counts = np.bincount(segments[answered] * len(bits) + combos[answered],
+                         minlength=len(data[segment].cat.categories) * len(bits))
+    counts = counts.reshape(len(data[segment].cat.categories), len(bits)) @ bits
+    return pd.DataFrame(counts, index=data[segment].cat.categories, columns=priority_options(data))
+
+
+# Everything the dashboard and the analysis script chart, computed in one go
+# per data version:
+#   cube['rows']                    number of respondents
+#   cube['counts'][column]          answer counts of each survey column, and of
+#                                   the Source when several sheets are merged
+#   cube['by'][segment][column]     answers of each column per segment answer
+#   cube['priorities']              counts of each food selection priority
+#   cube['priorities_by'][segment]  priority counts per segment answer
+#   cube['priority_pairs']          respondents picking both of two priorities
+#   cube['healthy']                 respondents meeting each healthy habit indicator
+#   cube['healthy_by'][segment]     indicator counts per segment answer
+#   cube['health_scores']           respondents per health score
+# `habits` is evaluate(data), when the caller has it already.
+def build_cube(data, habits=None):
+    columns = [column for column in [*SURVEY_SCHEMA, SOURCE] if column in data.columns]
+    habits = evaluate(data) if habits is None else habits
+    segments = [segment for segment in CUBE_SEGMENTS
+                if segment in data.columns and data[segment].dtype == 'category']
+    return {
+        'rows': len(data),
+        'counts': {column: column_counts(data[column]) for column in columns},
+        'by': {segment: breakdown(data, segment, columns) for segment in segments},
+        'priorities': priority_counts(data),
+        'priorities_by': {segment: priority_counts_by(data, segment) for segment in segments},
+        'priority_pairs': priority_cooccurrence(data),
+        'healthy': indicator_counts(habits),
+        'healthy_by': {segment: indicator_counts_by(habits, data[segment]) for segment in segments},
+        'health_scores': score_counts(habits),
+    }
+
+
+def _union(first, second):
+    seen = set(first)
+    return list(first) + [label for label in second if label not in seen]
+
+
+# Add two cubes (or parts of cubes) up; answers missing on one side count 0
+def _merge(total, part):
+    if isinstance(total, dict):
+        return {key: _merge(total[key], part[key]) if key in total and key in part else total.get(key, part.get(key))
+                for key in {**total, **part}}
+    if isinstance(total, pd.DataFrame):
+        index, columns = _union(total.index, part.index), _union(total.columns, part.columns)
+        return (total.reindex(index=index, columns=columns, fill_value=0)
+                + part.reindex(index=index, columns=columns, fill_value=0))
+    if isinstance(total, pd.Series):
+        index = _union(total.index, part.index)
+        return total.reindex(index, fill_value=0) + part.reindex(index, fill_value=0)
+    return total + part
+
+
+# Aggregates of a sheet read in chunks. Every chunk is folded into the running
+# totals and can be dropped right after, so memory use depends on the number of
+# distinct answers rather than on the number of rows. result() has the same
+# shape as build_cube() over all the rows seen so far.
+class RunningCube:
+    def __init__(self):
+        self.cube = None
+
+    @property
+    def rows(self):
+        return self.cube['rows'] if self.cube else 0
+
+    def update(self, chunk, habits=None):
+        part = build_cube(chunk, habits)
+        self.cube = part if self.cube is None else _merge(self.cube, part)
+
+    # Answers in schema order again, as each chunk only knew its own answers
+    def result(self):
+        if self.cube is None:
+            return None
+        cube = dict(self.cube)
+        cube['counts'] = {column: counts.reindex(categories_for(column, counts.index))
+                          for column, counts in cube['counts'].items()}
+        cube['by'] = {segment: {column: table.reindex(index=categories_for(column, table.index),
+                                                      columns=categories_for(segment, table.columns))
+                                for column, table in tables.items()}
+                      for segment, tables in cube['by'].items()}
+        for name in ('priorities_by', 'healthy_by'):
+            cube[name] = {segment: table.reindex(categories_for(segment, table.index))
+                          for segment, table in cube[name].items()}
+        return cube
@@ -0,0 +1,98 @@
+import os
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from survey_schema import SOURCE, SURVEY_SCHEMA
+
+# Rows one-hot encoded at a time by cooccurrence(), bounding its scratch
+# memory. Blocks are counted in float32, exact up to 2**24 rows.
+ASSOCIATION_BLOCK_ROWS = int(os.environ.get('MEALMETRICS_ASSOCIATION_BLOCK_ROWS', '65536'))
+
+
+# How many respondents gave each pair of answers, for every pair of
+# Categorical columns at once. Every answer of every column is one column of a
+# one-hot matrix X, so X.T @ X counts the respondents sharing each pair of
+# answers, and its block for columns a and b is their contingency table. The
+# rows go through in blocks, each a single matrix product. Rows and columns of
+# the result are indexed by (column, answer).
+def cooccurrence(data, columns=None):
+    columns = [column for column in (columns or [*SURVEY_SCHEMA, SOURCE])
+               if column in data.columns and data[column].dtype == 'category']
+    categories = [data[column].cat.categories for column in columns]
+    offsets = np.cumsum([0] + [len(answers) for answers in categories])
+    width = int(offsets[-1])
+    counts = np.zeros((width, width), dtype=np.int64)
+    for start in range(0, len(data), ASSOCIATION_BLOCK_ROWS):
+        block = slice(start, start + ASSOCIATION_BLOCK_ROWS)
+        codes = np.stack([data[column].cat.codes.to_numpy()[block] for column in columns], axis=1).astype(np.int64)
+        # Skipped questions (code -1) land in a spare last column, dropped below
+        slots = np.where(codes >= 0, offsets[:-1] + codes, width)
+        onehot = np.zeros((len(codes), width + 1), dtype=np.float32)
+        onehot[np.arange(len(codes))[:, None], slots] = 1
+        onehot = onehot[:, :width]
+        counts += (onehot.T @ onehot).astype(np.int64)
+    index = pd.MultiIndex.from_tuples([(column, answer) for column, answers in zip(columns, categories)
+                                       for answer in answers], names=['column', 'answer'])
+    return pd.DataFrame(counts, index=index, columns=index)
+
+
+# Add the co-occurrence counts of two sets of responses up
+def merge_cooccurrence(total, part):
+    seen = set(total.index)
+    index = pd.MultiIndex.from_tuples(list(total.index) + [label for label in part.index if label not in seen],
+                                      names=total.index.names)
+    return (total.reindex(index=index, columns=index, fill_value=0)
+            + part.reindex(index=index, columns=index, fill_value=0))
+
+
+# Contingency table of two columns: answers of `first` by answers of `second`
+def contingency(counts, first, second):
+    return counts.loc[first, second]
+
+
+# Chi-square statistic of independence, its degrees of freedom, Cramér's V and
+# the number of respondents of a contingency table. Answers nobody gave are
+# left out.
+def chi_square(table):
+    table = table[table.sum(axis=1) > 0][:, table.sum(axis=0) > 0]
+    respondents = int(table.sum())
+    if respondents == 0 or min(table.shape) < 2:
+        return 0.0, 0, 0.0, respondents
+    expected = np.outer(table.sum(axis=1), table.sum(axis=0)) / respondents
+    chi2 = float(((table - expected) ** 2 / expected).sum())
+    dof = (table.shape[0] - 1) * (table.shape[1] - 1)
+    cramers_v = float(np.sqrt(chi2 / (respondents * (min(table.shape) - 1))))
+    return chi2, dof, cramers_v, respondents
+
+
+# Association statistics of every pair of columns, from their co-occurrence
+# counts. Respondents who skipped either question are left out of that pair.
+#   associations['counts']     the co-occurrence counts, see contingency()
+#   associations['pairs']      one row per pair: chi-square, degrees of freedom,
+#                              Cramér's V and respondents, strongest first
+#   associations['cramers_v']  Cramér's V of every pair as a symmetric matrix
+def association_stats(counts):
+    columns = list(dict.fromkeys(counts.index.get_level_values('column')))
+    bounds = {column: counts.index.get_locs([column]) for column in columns}
+    values = counts.to_numpy()
+    pairs = []
+    for first, second in combinations(columns, 2):
+        chi2, dof, cramers_v, respondents = chi_square(values[np.ix_(bounds[first], bounds[second])])
+        pairs.append((first, second, chi2, dof, cramers_v, respondents))
+    pairs = pd.DataFrame(pairs, columns=['column', 'other', 'chi2', 'dof', 'cramers_v', 'respondents'])
+    matrix = pd.DataFrame(np.eye(len(columns)), index=columns, columns=columns)
+    for first, second, cramers_v in pairs[['column', 'other', 'cramers_v']].itertuples(index=False):
+        matrix.loc[first, second] = matrix.loc[second, first] = cramers_v
+    pairs = pairs.sort_values('cramers_v', ascending=False, ignore_index=True)
+    return {'counts': counts, 'pairs': pairs, 'cramers_v': matrix}
+
+
+def build_associations(data):
+    return association_stats(cooccurrence(data))
+
+
+# Fold newly arrived responses into `associations`; only the new rows are read
+def update_associations(associations, rows):
+    return association_stats(merge_cooccurrence(associations['counts'], cooccurrence(rows)))
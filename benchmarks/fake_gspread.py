@@ -0,0 +1,70 @@
+import time
+
+from local_sheet import LocalWorksheet
+
+
+# In-process stand-in for a gspread Worksheet. Every API call is counted and
+# can be slowed down by a fixed latency to mimic the round trip to Google.
+class FakeWorksheet(LocalWorksheet):
+    def __init__(self, frame, title='Sheet1', latency=0.0):
+        super().__init__(frame, title)
+        self.latency = latency
+        self.calls = 0
+
+    def _call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_all_values(self):
+        self._call()
+        return super().get_all_values()
+
+    def get_all_records(self):
+        self._call()
+        return super().get_all_records()
+
+    def get(self, range_name=None, major_dimension='ROWS'):
+        self._call()
+        return super().get(range_name, major_dimension)
+
+    # One API call for all the ranges, like the real batch_get
+    def batch_get(self, ranges, major_dimension='ROWS'):
+        self._call()
+        return [LocalWorksheet.get(self, range_name, major_dimension) for range_name in ranges]
+
+
+class FakeSpreadsheet:
+    def __init__(self, title, worksheets):
+        self.title = title
+        self._worksheets = worksheets
+
+    @property
+    def sheet1(self):
+        return self._worksheets[0]
+
+    def worksheet(self, title):
+        return next(worksheet for worksheet in self._worksheets if worksheet.title == title)
+
+    def worksheets(self):
+        return list(self._worksheets)
+
+
+# Stand-in for the authorized gspread Client: `spreadsheets` maps spreadsheet
+# names to lists of FakeWorksheets
+class FakeClient:
+    def __init__(self, spreadsheets, latency=0.0):
+        self.spreadsheets = {name: FakeSpreadsheet(name, worksheets) for name, worksheets in spreadsheets.items()}
+        self.latency = latency
+        self.opens = 0
+
+    def open(self, title):
+        self.opens += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.spreadsheets[title]
+
+
+# Replacement for gspread.authorize
+def authorize(credentials=None, spreadsheets=None, latency=0.0):
+    return FakeClient(spreadsheets or {}, latency)
@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import time
+from statistics import median
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+import data_loader
+from aggregates import build_cube
+from associations import build_associations, update_associations
+from benchmarks.fake_gspread import FakeWorksheet
+from benchmarks.synthetic import generate_responses
+from data_loader import MultiSheetSync, SheetCache, SheetSync, StreamingCache
+from snapshot_store import load_snapshot, save_snapshot
+from trends import build_trends, update_trends
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(ROOT, 'benchmarks', 'results', 'results.jsonl')
+STAGES = ['load', 'sync', 'stream', 'snapshot', 'aggregates', 'trends', 'associations', 'pages', 'analysis']
+
+
+# Run `run` `repeat` times and return the wall time of each run. `setup` runs
+# untimed before every run and whatever it returns is passed to `run`.
+def measure(run, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        args = (setup() if setup else None) or ()
+        start = time.perf_counter()
+        run(*args)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def bench_load(responses, repeat, latency):
+    worksheet = FakeWorksheet(responses, latency=latency)
+    return {'load: full sheet': measure(lambda: SheetSync(lambda: worksheet).load(), repeat)}
+
+
+# Sync 1% of new responses into an already loaded frame
+def bench_sync(responses, repeat, latency):
+    new_rows = responses.tail(max(len(responses) // 100, 1))
+    base = responses.iloc[:len(responses) - len(new_rows)]
+
+    def setup():
+        worksheet = FakeWorksheet(base, latency=latency)
+        sync = SheetSync(lambda: worksheet)
+        data = sync.load()
+        worksheet.append_rows(new_rows.values.tolist())
+        return sync, data
+
+    return {'sync: +1% rows': measure(lambda sync, data: sync.sync(data), repeat, setup)}
+
+
+# Streaming mode: the whole sheet in chunks into running aggregates, the same
+# rows split across two sources, then a refresh streaming only 1% of new rows
+def bench_stream(responses, repeat, latency):
+    new_rows = responses.tail(max(len(responses) // 100, 1))
+    base = responses.iloc[:len(responses) - len(new_rows)]
+    halves = {'first': base.iloc[:len(base) // 2], 'second': base.iloc[len(base) // 2:]}
+
+    def setup():
+        worksheet = FakeWorksheet(base, latency=latency)
+        return StreamingCache(SheetSync(lambda: worksheet)), worksheet
+
+    def setup_sources():
+        worksheets = {label: FakeWorksheet(rows, latency=latency) for label, rows in halves.items()}
+        syncs = {label: SheetSync(lambda worksheet=worksheet: worksheet) for label, worksheet in worksheets.items()}
+        return StreamingCache(MultiSheetSync(syncs)), worksheets
+
+    def refresh(cache, worksheet):
+        cache.get()
+        worksheet.append_rows(new_rows.values.tolist())
+        cache.invalidate()
+        return cache, worksheet
+
+    return {'stream: full sheet': measure(lambda cache, worksheet: cache.cube(), repeat, setup),
+            'stream: 2 sources': measure(lambda cache, worksheets: cache.cube(), repeat, setup_sources),
+            'stream: +1% rows': measure(lambda cache, worksheet: cache.cube(), repeat,
+                                        lambda: refresh(*setup()))}
+
+
+def bench_snapshot(responses, repeat, latency):
+    data = SheetSync(lambda: FakeWorksheet(responses)).load()
+    with tempfile.TemporaryDirectory() as directory:
+        save = measure(lambda: save_snapshot(data, 1, directory=directory), repeat)
+        load = measure(lambda: load_snapshot(directory=directory), repeat)
+    return {'snapshot: save': save, 'snapshot: load': load}
+
+
+def bench_aggregates(responses, repeat, latency):
+    data = SheetSync(lambda: FakeWorksheet(responses)).load()
+    return {'aggregates: build cube': measure(lambda: build_cube(data), repeat)}
+
+
+# Daily trends of the whole sheet, and brought up to date with 1% of new rows
+def bench_trends(responses, repeat, latency):
+    data = SheetSync(lambda: FakeWorksheet(responses)).load()
+    split = len(data) - max(len(data) // 100, 1)
+    trends = build_trends(data.iloc[:split])
+    return {'trends: build': measure(lambda: build_trends(data), repeat),
+            'trends: +1% rows': measure(lambda: update_trends(trends, data.iloc[split:]), repeat)}
+
+
+# Pairwise associations of the survey columns, from scratch and brought up to
+# date with 1% of new rows
+def bench_associations(responses, repeat, latency):
+    data = SheetSync(lambda: FakeWorksheet(responses)).load()
+    split = len(data) - max(len(data) // 100, 1)
+    associations = build_associations(data.iloc[:split])
+    return {'associations: build': measure(lambda: build_associations(data), repeat),
+            'associations: +1% rows': measure(lambda: update_associations(associations, data.iloc[split:]), repeat)}
+
+
+# Full Streamlit reruns of the data pages, through the app's own data layer
+# backed by the fake worksheet. Cold runs start with empty caches.
+def bench_pages(responses, repeat, latency):
+    from streamlit.testing.v1 import AppTest
+
+    import figures
+
+    worksheet = FakeWorksheet(responses, latency=latency)
+    app = os.path.join(ROOT, 'MealMetrics_webapp.py')
+
+    def rerun(page):
+        test = AppTest.from_file(app, default_timeout=600)
+        test.session_state['menu'] = page
+        test.run()
+        if test.exception:
+            raise RuntimeError(test.exception[0].value)
+
+    def cold():
+        data_loader.sheet_cache = SheetCache(SheetSync(lambda: worksheet))
+        figures.figure_cache.clear()
+
+    results = {}
+    for page in ['HOMEPAGE', 'PANEL']:
+        results[f'page: {page} cold'] = measure(lambda: rerun(page), repeat, cold)
+        results[f'page: {page} warm'] = measure(lambda: rerun(page), repeat)
+    return results
+
+
+# The analysis script's batch report: every figure rendered to PNG and HTML,
+# in this process and across a process pool
+def bench_analysis(responses, repeat, latency):
+    from Meal_Metrics_Analysis import render_report
+
+    cube = build_cube(SheetSync(lambda: FakeWorksheet(responses)).load())
+    with tempfile.TemporaryDirectory() as out:
+        return {'analysis: report serial': measure(lambda: render_report(cube, out, ['png', 'html'], 1), repeat),
+                'analysis: report parallel': measure(lambda: render_report(cube, out, ['png', 'html']), repeat)}
+
+
+def revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as results:
+        return [json.loads(line) for line in results if line.strip()]
+
+
+# Latest result of every (stage, rows) from an earlier revision
+def baseline(results, current):
+    previous = {}
+    for result in results:
+        if result['revision'] != current:
+            previous[(result['stage'], result['rows'])] = result
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the MealMetrics load, aggregation and render stages')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated seconds per Sheets API call')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--threshold', type=float, default=0.10, help='slowdown reported as a regression')
+    parser.add_argument('--results', default=RESULTS)
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    current = revision()
+    previous = baseline(load_results(args.results), current)
+    benches = {stage: globals()[f'bench_{stage}'] for stage in args.stages}
+    records = []
+
+    print(f'{"stage":<28}{"rows":>10}{"min ms":>12}{"median ms":>12}{"previous":>12}{"change":>9}')
+    for rows in args.rows:
+        responses = generate_responses(rows)
+        for bench in benches.values():
+            for stage, times in bench(responses, args.repeat, args.latency).items():
+                record = {'revision': current, 'timestamp': time.time(), 'stage': stage, 'rows': rows,
+                          'min': min(times), 'median': median(times), 'repeat': len(times)}
+                records.append(record)
+
+                before = previous.get((stage, rows))
+                change = flag = ''
+                if before:
+                    ratio = record['min'] / before['min'] - 1
+                    change = f'{ratio:+.0%}'
+                    flag = '  REGRESSION' if ratio > args.threshold else ''
+                print(f'{stage:<28}{rows:>10}{record["min"] * 1000:>12.1f}{record["median"] * 1000:>12.1f}'
+                      f'{before["min"] * 1000 if before else float("nan"):>12.1f}{change:>9}{flag}')
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(args.results), exist_ok=True)
+        with open(args.results, 'a') as results:
+            for record in records:
+                results.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
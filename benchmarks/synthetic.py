@@ -0,0 +1,69 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from survey_schema import PRIORITIES, PRIORITY_OPTIONS, SURVEY_SCHEMA
+
+# Header of the response sheet, in the order Google Forms writes it
+COLUMNS = ['Timestamp', 'Name', 'Gender', 'Dietary Preferences', 'Meal Frequency', 'Nutritional Consideration',
+           'Fruits and Vegetables Consumption', 'Whole Grains Consumption', 'Snacking Habits', 'Eating Out Frequency',
+           'Food Label Reading Habits', 'Steps to Improve Diet', 'Health Consciousness', PRIORITIES,
+           'Food Preference']
+
+# Answers for the columns the schema doesn't declare
+EXTRA_ANSWERS = {
+    'Food Preference': ['Home-cooked food', 'Restaurant food', 'Street food', 'Packaged food'],
+}
+
+
+def _answers(column):
+    return SURVEY_SCHEMA[column][0] or EXTRA_ANSWERS[column]
+
+
+# Survey responses shaped like the real sheet: every value is a string as the
+# sheet displays it, timestamps increase, answers follow a skewed distribution
+# per question and the priorities question picks 1-3 options.
+def generate_responses(rows, seed=0, start='2023-12-01'):
+    rng = np.random.default_rng(seed)
+    data = {}
+
+    seconds = np.cumsum(rng.integers(1, 600, size=rows))
+    data['Timestamp'] = (pd.Timestamp(start) + pd.to_timedelta(seconds, unit='s')).strftime('%m/%d/%Y %H:%M:%S')
+    data['Name'] = pd.Series(np.arange(rows)).map('respondent{}'.format).to_numpy()
+
+    for column in COLUMNS[2:]:
+        if column == PRIORITIES:
+            continue
+        answers = np.array(_answers(column), dtype=object)
+        weights = rng.dirichlet(np.ones(len(answers)) * 2)
+        data[column] = answers[rng.choice(len(answers), size=rows, p=weights)]
+
+    # Each respondent picks 1-3 options; the joined answer of every combination
+    # is built once and then looked up
+    n_options = len(PRIORITY_OPTIONS)
+    combos = [mask for mask in range(1, 2 ** n_options) if 1 <= bin(mask).count('1') <= 3]
+    labels = np.array([', '.join(option for bit, option in enumerate(PRIORITY_OPTIONS) if mask >> bit & 1)
+                       for mask in combos], dtype=object)
+    data[PRIORITIES] = labels[rng.integers(0, len(labels), size=rows)]
+
+    return pd.DataFrame(data, columns=COLUMNS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write synthetic MealMetrics survey responses to a CSV or Parquet file')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='survey.csv')
+    args = parser.parse_args()
+
+    responses = generate_responses(args.rows, args.seed)
+    if args.out.endswith('.csv'):
+        responses.to_csv(args.out, index=False)
+    else:
+        responses.to_parquet(args.out, index=False)
+    print(f'Wrote {len(responses)} responses to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,752 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from aggregates import RunningCube, build_cube
+from associations import association_stats, build_associations, cooccurrence, merge_cooccurrence, update_associations
+from indicators import evaluate, update_habits
+from instrumentation import count, gauge, span
+from local_sheet import open_local
+from sheets_client import backoff_delay, sheets_client, with_backoff
+from snapshot_store import (SNAPSHOT_DIR, LeaderLock, latest_version, load_artifacts, load_snapshot,
+                            save_snapshot, snapshot_versions)
+from survey_schema import (SOURCE, SURVEY_SCHEMA, append_rows, apply_schema, encode_column, merge_sources,
+                           split_sources)
+from trends import build_trends, update_trends
+
+# The spreadsheet holding the survey responses
+SPREADSHEET = os.environ.get('MEALMETRICS_SPREADSHEET', 'mealmetrics_data')
+
+# A local CSV/Parquet export to read instead of Google Sheets, for running
+# without credentials or network
+OFFLINE_SOURCE = os.environ.get('MEALMETRICS_OFFLINE_SOURCE')
+
+# Several survey waves or regions, each in its own sheet, loaded side by side
+# and merged into one frame with a Source column. Sources are separated by ';'
+# and written as [label=]spreadsheet[!worksheet] or [label=]path/to/export.csv,
+# e.g. "Wave 1=mealmetrics_data;Wave 2=mealmetrics_wave2!North"
+SOURCES = [source.strip() for source in os.environ.get('MEALMETRICS_SOURCES', '').split(';') if source.strip()]
+
+# Persist every loaded version to a local Arrow snapshot and cold-start from it
+SNAPSHOTS = os.environ.get('MEALMETRICS_SNAPSHOTS', '1') == '1'
+
+# Directory the server processes of one deployment share the survey data
+# through, ideally in memory (e.g. /dev/shm/mealmetrics). Only one process then
+# syncs the sheet; the others map what it publishes. Unset, every process
+# loads the sheet on its own.
+SHARED_DIR = os.environ.get('MEALMETRICS_SHARED_DIR')
+
+# Seconds a process with nothing loaded yet waits for the first shared snapshot
+SHARED_WAIT = float(os.environ.get('MEALMETRICS_SHARED_WAIT', '60'))
+
+# Seconds a loaded sheet is served from memory before it is fetched again
+CACHE_TTL = float(os.environ.get('MEALMETRICS_CACHE_TTL', '300'))
+
+# After a failed refresh the last good data is served for a cooldown before
+# the next attempt, doubling with every failure in a row up to the maximum
+REFRESH_COOLDOWN = float(os.environ.get('MEALMETRICS_REFRESH_COOLDOWN', '30'))
+REFRESH_COOLDOWN_MAX = float(os.environ.get('MEALMETRICS_REFRESH_COOLDOWN_MAX', '600'))
+
+# Streaming mode, for sheets too big for memory or for a single API response:
+# the sheet is read CHUNK_ROWS rows at a time, every chunk is folded into the
+# aggregates and dropped, and only the first PREVIEW_ROWS rows are kept
+STREAMING = os.environ.get('MEALMETRICS_STREAMING') == '1'
+CHUNK_ROWS = int(os.environ.get('MEALMETRICS_CHUNK_ROWS', '10000'))
+PREVIEW_ROWS = int(os.environ.get('MEALMETRICS_PREVIEW_ROWS', '1000'))
+
+logger = logging.getLogger('mealmetrics')
+
+
+# The sheet with the survey responses, through the process-wide authorized
+# client. gspread and the OAuth client are only imported once a sheet is
+# actually opened.
+def open_sheet():
+    if OFFLINE_SOURCE:
+        return open_local(OFFLINE_SOURCE)
+    return sheets_client.worksheet(SPREADSHEET)
+
+
+# Label and opener of a MEALMETRICS_SOURCES entry
+def parse_source(source):
+    label, _, target = source.rpartition('=')
+    target = target.strip()
+    if target.endswith(('.csv', '.parquet')):
+        opener = lambda: open_local(target)
+    else:
+        spreadsheet, _, worksheet = target.partition('!')
+        opener = lambda: sheets_client.worksheet(spreadsheet, worksheet or None)
+    return label.strip() or target, target, opener
+
+
+# Decode the raw strings of a non-survey column: a column whose filled cells
+# are all numbers becomes numeric, anything else stays text
+def decode_values(values):
+    values = np.asarray(values, dtype=object)
+    filled = values != ''
+    if not filled.any():
+        return values
+    try:
+        float(values[filled.argmax()])
+    except ValueError:
+        return values
+    numbers = pd.to_numeric(values, errors='coerce')
+    return values if np.isnan(numbers[filled]).any() else numbers
+
+
+# Decode the raw strings of rows appended to the non-survey column `existing`
+# into what a full load of the whole column would give. None when the new
+# values change the column's type (text in a numeric column, or numbers in one
+# blank so far), which takes a full load.
+def decode_appended(existing, values):
+    values = np.asarray(values, dtype=object)
+    filled = values != ''
+    if pd.api.types.is_numeric_dtype(existing):
+        numbers = pd.to_numeric(values, errors='coerce')
+        return None if np.isnan(numbers[filled]).any() else numbers
+    # A text column with a filled first cell is text for good; only a column
+    # blank so far can still turn numeric
+    if (len(existing) and existing.iat[0] != '') or (existing != '').any():
+        return values
+    return values if decode_values(values) is values else None
+
+
+# Build the frame from the sheet's values fetched column by column, as
+# returned for majorDimension=COLUMNS: every column starts with its header and
+# is cut short after its last filled cell. Each column goes straight into its
+# final dtype (survey columns are encoded as Categoricals without an
+# intermediate object column) and its raw values are dropped as soon as it is
+# decoded, so the load never holds more than one column's worth of extra
+# copies.
+def columns_to_frame(columns):
+    rows = max(map(len, columns), default=1) - 1
+    header = [str(column[0]) if column else '' for column in columns]
+    decoded = {}
+    with span('frame.build') as details:
+        details['rows'] = rows
+        for position, name in enumerate(header):
+            values = columns[position][1:]
+            columns[position] = None
+            values += [''] * (rows - len(values))
+            decoded[position] = encode_column(name, values) if name in SURVEY_SCHEMA else decode_values(values)
+        frame = pd.DataFrame(decoded, index=pd.RangeIndex(rows))
+    frame.columns = header
+    return frame
+
+
+# Responses are only ever appended to the sheet, so after the first full load
+# we remember the header and the last row we ingested and only ask for the rows
+# after it. The last ingested row is fetched again with every sync: if it no
+# longer matches (rows were edited or deleted above it), or the header changed,
+# we fall back to a full reload.
+class SheetSync:
+    def __init__(self, open_sheet=open_sheet, name=OFFLINE_SOURCE or SPREADSHEET):
+        self.open_sheet = open_sheet
+        self.name = name
+        self.reset()
+
+    # Forget the sync position so the next refresh reloads the whole sheet
+    def reset(self):
+        self.header = None
+        self.rows = 0
+        self.last_row = None
+        # Rows the last refresh appended to the end of the frame it was given,
+        # or None when it loaded the frame anew
+        self.appended = None
+
+    # The last ingested row doubles as the checksum for the next sync; before
+    # any responses arrive the header row plays that role
+    def _remember(self, header, added, last_row=None):
+        self.header = header
+        self.rows += added
+        self.last_row = self._pad(last_row or self.last_row or header)
+
+    # Sync position saved along with a snapshot, so a restarted process can
+    # carry on from the snapshot instead of downloading the whole sheet again
+    def state(self):
+        return {'name': self.name, 'header': self.header, 'rows': self.rows, 'last_row': self.last_row}
+
+    def restore(self, state):
+        if state.get('name') != self.name:
+            return False
+        self.header, self.rows, self.last_row = state['header'], state['rows'], state['last_row']
+        return True
+
+    def _pad(self, row):
+        return row + [''] * (len(self.header) - len(row))
+
+    # Column letter of the last header column
+    def _last_col(self):
+        import gspread.utils
+
+        return gspread.utils.rowcol_to_a1(1, len(self.header)).rstrip('0123456789')
+
+    # Whether the header and the last ingested row are still what we ingested
+    def unchanged(self, sheet):
+        if not self.header:
+            return False
+        header, last = with_backoff(sheet.batch_get, ['1:1', f'A{self.rows + 1}:{self._last_col()}{self.rows + 1}'])
+        return (header[0] if header else []) == self.header and bool(last) and self._pad(last[0]) == self.last_row
+
+    # Read the rows after the ingested ones in chunks of `chunk_rows`, each as
+    # its own encoded frame. A chunk is only fetched when the consumer asks for
+    # it, so the consumer decides how many are held at once.
+    def iter_chunks(self, sheet=None, chunk_rows=CHUNK_ROWS):
+        sheet = sheet or self.open_sheet()
+        if not self.header:
+            self.reset()
+            self._remember(with_backoff(sheet.row_values, 1), 0)
+        if not self.header:
+            return
+        header, last_col = self.header, self._last_col()
+        while True:
+            start = self.rows + 2
+            with span('sheets.fetch_chunk') as details:
+                columns = with_backoff(sheet.get, f'A{start}:{last_col}{start + chunk_rows - 1}',
+                                       major_dimension='COLUMNS')
+                rows = max(map(len, columns), default=0)
+                details['rows'] = rows
+            if not rows:
+                return
+            self._remember(header, rows, [column[-1] if len(column) == rows else '' for column in columns])
+            frame = columns_to_frame([[name] + (columns[i] if i < len(columns) else [])
+                                      for i, name in enumerate(header)])
+            del columns
+            with span('schema.encode'):
+                chunk = apply_schema(frame)
+            yield chunk
+            if rows < chunk_rows:
+                return
+
+    # Download the whole sheet in one call, column by column
+    def load(self, sheet=None):
+        sheet = sheet or self.open_sheet()
+        with span('sheets.fetch') as details:
+            columns = with_backoff(sheet.get, major_dimension='COLUMNS')
+            rows = max(map(len, columns), default=1) - 1
+            details['rows'] = rows
+        self.reset()
+        header = [str(column[0]) if column else '' for column in columns]
+        last_row = [column[rows] if len(column) > rows else '' for column in columns] if rows else None
+        self._remember(header, rows, last_row)
+        frame = columns_to_frame(columns)
+        with span('schema.encode'):
+            return apply_schema(frame)
+
+    # Append the rows added since the last refresh to `data`. Returns `data`
+    # itself when nothing changed.
+    def sync(self, data):
+        sheet = self.open_sheet()
+        if not self.header:
+            return self.load(sheet)
+        # The header lives on row 1, so the last ingested row is row `self.rows + 1`
+        with span('sheets.fetch_tail') as details:
+            header, tail = with_backoff(sheet.batch_get, ['1:1', f'A{self.rows + 1}:{self._last_col()}'])
+            details['rows'] = max(len(tail) - 1, 0)
+        header = header[0] if header else []
+        if header != self.header or not tail or self._pad(tail[0]) != self.last_row:
+            return self.load(sheet)
+        new_rows = tail[1:]
+        if not new_rows:
+            return data
+        # The new rows are decoded column by column like a full load, into the
+        # dtypes the frame already has; survey columns are encoded on append
+        with span('frame.build') as details:
+            details['rows'] = len(new_rows)
+            decoded = {}
+            for position, name in enumerate(self.header):
+                values = [row[position] if position < len(row) else '' for row in new_rows]
+                decoded[position] = (values if name in SURVEY_SCHEMA
+                                     else decode_appended(data.iloc[:, position], values))
+                if decoded[position] is None:
+                    return self.load(sheet)
+            frame = pd.DataFrame(decoded, index=pd.RangeIndex(len(new_rows)))
+            frame.columns = self.header
+        self._remember(self.header, len(new_rows), new_rows[-1])
+        self.appended = len(new_rows)
+        with span('schema.append'):
+            return append_rows(data, frame)
+
+    def refresh(self, data):
+        if data is None or self.header is None:
+            return self.load()
+        return self.sync(data)
+
+
+# Several sheets loaded and synced concurrently, one SheetSync each, and merged
+# into one frame tagged with each response's source. A refresh takes about as
+# long as the slowest sheet, and when no sheet changed the merged frame is
+# returned as it was. `sources` are MEALMETRICS_SOURCES entries, or
+# {label: SheetSync}.
+class MultiSheetSync:
+    def __init__(self, sources=SOURCES, workers=None):
+        if isinstance(sources, dict):
+            self.syncs = dict(sources)
+        else:
+            self.syncs = {}
+            for source in sources:
+                label, target, opener = parse_source(source)
+                self.syncs[label] = SheetSync(opener, name=target)
+        self.name = ';'.join(sources)
+        self.workers = workers or len(self.syncs)
+        self.parts = {}
+        # The merged frame is rebuilt whenever a sheet changed, so new rows are
+        # never just appended to its end
+        self.appended = None
+        # Whether parts were synced since the merged frame was last built
+        self.pending = False
+
+    # Header of the first sheet, for callers that need one
+    @property
+    def header(self):
+        return next(iter(self.syncs.values())).header
+
+    def reset(self):
+        for sync in self.syncs.values():
+            sync.reset()
+        self.parts = {}
+        self.pending = False
+
+    def state(self):
+        return {'name': self.name, 'sources': {label: sync.state() for label, sync in self.syncs.items()}}
+
+    def restore(self, state):
+        if state.get('name') != self.name:
+            return False
+        self.parts = {}
+        return all(sync.restore(state['sources'][label]) for label, sync in self.syncs.items())
+
+    def load(self):
+        self.reset()
+        return self.refresh(None)
+
+    def sync(self, data):
+        return self.refresh(data)
+
+    def refresh(self, data):
+        # After a cold start from a snapshot only the merged frame is known
+        if data is not None and not self.parts:
+            self.parts = split_sources(data)
+        with span('sheets.fetch_sources') as details:
+            details['sources'] = len(self.syncs)
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = {label: pool.submit(sync.refresh, self.parts.get(label))
+                           for label, sync in self.syncs.items()}
+            parts, errors = {}, []
+            for label, future in futures.items():
+                try:
+                    parts[label] = future.result()
+                except Exception as error:
+                    # A failed sheet keeps its sync position and is synced
+                    # again next time; what the others synced is kept
+                    parts[label] = self.parts.get(label)
+                    errors.append(error)
+        self.pending = self.pending or any(parts[label] is not self.parts.get(label) for label in parts)
+        self.parts = parts
+        if errors:
+            raise errors[0]
+        if data is not None and not self.pending:
+            return data
+        self.pending = False
+        with span('frame.merge'):
+            return merge_sources(parts)
+
+    # Streaming mode reads the sheets one after the other
+    def open_sheet(self):
+        return None
+
+    def unchanged(self, sheet=None):
+        return all(sync.unchanged(sync.open_sheet()) for sync in self.syncs.values())
+
+    def iter_chunks(self, sheet=None, chunk_rows=CHUNK_ROWS):
+        for label, sync in self.syncs.items():
+            for chunk in sync.iter_chunks(chunk_rows=chunk_rows):
+                chunk[SOURCE] = pd.Categorical([label] * len(chunk))
+                yield chunk
+
+
+# The sheet (or sheets) the survey is read from
+def default_source():
+    return MultiSheetSync() if SOURCES else SheetSync()
+
+
+# One published version of the survey data and what is derived from it. Its
+# data never changes once published: a refresh builds the next snapshot and
+# swaps it in whole, so a rerun holding on to one sees a single consistent
+# version however long it runs, even when a refresh lands in the middle.
+class Snapshot:
+    def __init__(self, data=None, version=0, rows=None, artifacts=None, previous=None):
+        self.data = data
+        self.version = version
+        # Number of responses in the sheet; more than len(data) in streaming mode
+        self.rows = (0 if data is None else len(data)) if rows is None else rows
+        self._artifacts = dict(artifacts or {})
+        # When this snapshot's data is the previous snapshot's with rows
+        # appended: that snapshot's artifacts and its number of rows
+        self.previous = previous
+        # Reentrant, as artifacts are built from other artifacts
+        self._lock = threading.RLock()
+
+    def get(self):
+        return self.data
+
+    # Something derived from the data (aggregates, indexes, ...), built once
+    # per snapshot and shared by every session
+    def artifact(self, name, build):
+        with self._lock:
+            if name in self._artifacts:
+                count('artifact.hit')
+            else:
+                count('artifact.miss')
+                with span('artifact.build', artifact=name[0] if isinstance(name, tuple) else name):
+                    self._artifacts[name] = build(self.data)
+            return self._artifacts[name]
+
+    # An artifact kept up to date incrementally. When the previous snapshot
+    # has it and this one only appended rows to its data, `update(artifact,
+    # rows)` folds just those rows into it; otherwise `build` reads all the data.
+    def running_artifact(self, name, build, update):
+        if self.previous is not None:
+            artifacts, rows = self.previous
+            if artifacts.get(name) is not None and rows <= len(self.data):
+                return self.artifact(name, lambda data: update(artifacts[name], data.iloc[rows:]))
+        return self.artifact(name, build)
+
+    # Which healthy habit indicators every respondent meets, from
+    # indicators.evaluate(). The cube, the trends and the filtered cubes all
+    # read it, so it is evaluated once per snapshot.
+    def habits(self):
+        return self.running_artifact('habits', evaluate, update_habits)
+
+    # The aggregates of build_cube() over the whole sheet
+    def cube(self):
+        return self.artifact('cube', lambda data: build_cube(data, self.habits()))
+
+    # Daily trends of trends.build_trends()
+    def trends(self):
+        # The appended rows are the last ones, of the data and of its habits
+        def update(trends, rows):
+            return update_trends(trends, rows, self.habits().iloc[len(self.data) - len(rows):])
+        return self.running_artifact('trends', lambda data: build_trends(data, self.habits()), update)
+
+    # Pairwise association statistics of associations.build_associations()
+    def associations(self):
+        return self.running_artifact('associations', build_associations, update_associations)
+
+
+# Process-wide cache of the survey data, shared by every Streamlit session.
+# `version` goes up each time new data is loaded, so other caches can key on it.
+# The data is refreshed into `self.data` under the lock and then published as
+# `current`, a Snapshot; sessions only ever read published snapshots.
+class SheetCache:
+    def __init__(self, source=None, ttl=CACHE_TTL, snapshots=False, snapshot_dir=SNAPSHOT_DIR):
+        self.source = source or default_source()
+        self.ttl = ttl
+        self.snapshots = snapshots
+        self.snapshot_dir = snapshot_dir
+        self.data = None
+        self.version = 0
+        # Syncs that changed self.data since the published snapshot: more
+        # than none when preparing or saving a snapshot failed
+        self.unpublished = 0
+        self.expires_at = 0.0
+        # Set while a refresher.Refresher keeps the data up to date
+        self.background = False
+        self.current = Snapshot()
+        # The error of the latest refresh if it failed, and failures in a row
+        self.last_error = None
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def is_fresh(self):
+        return self.current.data is not None and time.monotonic() < self.expires_at
+
+    # Whether the published snapshot can be served as is. With a background
+    # refresher an expired snapshot still is: the refresher replaces it, and
+    # only the very first load makes a rerun wait for Google Sheets.
+    def _servable(self):
+        return self.is_fresh() or (self.background and self.current.data is not None)
+
+    # The latest published snapshot, refreshed first if it expired. Refreshes
+    # are single flight: while one caller fetches, the others are served the
+    # snapshot already published, and only wait when there is none yet. A
+    # failed refresh leaves the last good snapshot in place.
+    def snapshot(self):
+        if self._servable():
+            count('sheet_cache.hit')
+            return self.current
+        if not self._lock.acquire(blocking=self.current.data is None):
+            count('sheet_cache.stale')
+            return self.current
+        try:
+            # Another session may have reloaded the sheet while we were waiting
+            if self._servable():
+                count('sheet_cache.hit')
+            elif self.last_error is not None and self.retry_in() > 0:
+                # The first load failed and is cooling down; there is nothing to serve
+                raise self.last_error
+            else:
+                try:
+                    self._update()
+                except Exception:
+                    if self.current.data is None:
+                        raise
+            return self.current
+        finally:
+            self._lock.release()
+
+    def get(self):
+        return self.snapshot().get()
+
+    # Bring the data up to date now and publish it. `prepare` gets the new
+    # snapshot before it is published, e.g. to build its aggregates.
+    def update(self, prepare=None):
+        with self._lock:
+            self._update(prepare)
+        return self.current
+
+    def _update(self, prepare=None):
+        if self.data is None and self.snapshots:
+            with span('snapshot.load'):
+                self._restore_snapshot()
+            if self.is_fresh():
+                return
+        count('sheet_cache.miss')
+        try:
+            with span('sheet_cache.refresh'):
+                changed = self._refresh()
+        except Exception as error:
+            self._failed(error)
+            raise
+        self.last_error, self.failures = None, 0
+        # Data synced by an update that failed to publish it is published now,
+        # even when the sheet didn't change since
+        self.unpublished += changed
+        if self.unpublished:
+            snapshot = self._snapshot(self.version + 1)
+            if prepare is not None:
+                prepare(snapshot)
+            if self.snapshots:
+                with span('snapshot.save'):
+                    self._save(snapshot)
+            # Only the latest snapshot builds on its predecessor's artifacts
+            self.current.previous = None
+            self.current, self.version, self.unpublished = snapshot, snapshot.version, 0
+        self.expires_at = time.monotonic() + self.ttl
+        gauge('survey.rows', self.rows)
+        gauge('data.version', self.version)
+
+    # Hold off the next attempt for a cooldown that grows with every failure
+    # in a row, serving the last good data meanwhile
+    def _failed(self, error):
+        self.last_error = error
+        self.failures += 1
+        count('sheet_cache.error')
+        logger.warning('could not refresh the survey data (%d failures in a row): %s', self.failures, error)
+        self.expires_at = time.monotonic() + self.retry_delay()
+
+    # Cooldown after the current run of failures
+    def retry_delay(self):
+        return backoff_delay(self.failures - 1, REFRESH_COOLDOWN, REFRESH_COOLDOWN_MAX) if self.failures else 0
+
+    # Seconds until the next refresh is due
+    def retry_in(self):
+        return max(self.expires_at - time.monotonic(), 0)
+
+    # Bring self.data up to date; returns whether anything changed
+    def _refresh(self):
+        data = self.source.refresh(self.data)
+        changed = data is not self.data
+        self.data = data
+        return changed
+
+    # Artifacts of the published snapshot that the next one can build on, and
+    # its number of rows, when the data only had rows appended since. That is
+    # only known when the last sync is the one change since it was published.
+    def _previous(self):
+        appended = getattr(self.source, 'appended', None)
+        if not appended or self.unpublished != 1 or self.current.data is None:
+            return None
+        if len(self.data) - appended != len(self.current.data):
+            return None
+        return self.current._artifacts, len(self.current.data)
+
+    # The snapshot to publish for the current data, as `version`
+    def _snapshot(self, version):
+        return Snapshot(self.data, version, previous=self._previous())
+
+    def _save(self, snapshot):
+        save_snapshot(snapshot.data, snapshot.version, {'sync': self.source.state()}, self.snapshot_dir)
+
+    # Number of responses in the sheet
+    @property
+    def rows(self):
+        return self.current.rows
+
+    # Cold start from the latest local snapshot. It is served without touching
+    # the network until it is older than the TTL, and after that only the rows
+    # added since it was taken are fetched.
+    def _restore_snapshot(self):
+        data, meta = load_snapshot(directory=self.snapshot_dir)
+        if data is None or not self.source.restore(meta['sync']):
+            # Snapshots of another source are not served. Versions carry on
+            # above theirs, so the latest version on disk is this cache's.
+            self.version = max([self.version, *snapshot_versions(self.snapshot_dir)])
+            return
+        self.data = apply_schema(data)
+        self.version = meta['version']
+        self.current = Snapshot(self.data, self.version, artifacts=load_artifacts(self.version, self.snapshot_dir))
+        self.expires_at = time.monotonic() + self.ttl - (time.time() - meta['saved_at'])
+
+    def artifact(self, name, build):
+        return self.snapshot().artifact(name, build)
+
+    def cube(self):
+        return self.snapshot().cube()
+
+    # Force the next get() to go back to Google Sheets. With `full` the whole
+    # sheet is downloaded again instead of only the new rows.
+    def invalidate(self, full=False):
+        with self._lock:
+            self.expires_at = 0.0
+            if full:
+                self.source.reset()
+
+
+# Survey cache for sheets that don't fit in memory. The sheet is streamed in
+# chunks into running aggregates, and later refreshes stream only the rows
+# appended since (or everything again, if rows above them changed). get()
+# returns just a preview of the first rows; cube() covers the whole sheet.
+class StreamingCache(SheetCache):
+    def __init__(self, source=None, ttl=CACHE_TTL, chunk_rows=CHUNK_ROWS, preview_rows=PREVIEW_ROWS):
+        super().__init__(source, ttl)
+        self.chunk_rows = chunk_rows
+        self.preview_rows = preview_rows
+        self.running = None
+        self.running_trends = None
+        self.running_cooccurrence = None
+        # Whether chunks were folded in since the last published snapshot
+        self.pending = False
+
+    def _refresh(self):
+        sheet = self.source.open_sheet()
+        restart = self.running is None or not self.source.unchanged(sheet)
+        if restart:
+            self.source.reset()
+            self.running, self.running_trends, self.data = RunningCube(), None, None
+            self.running_cooccurrence = None
+        try:
+            for chunk in self.source.iter_chunks(sheet, self.chunk_rows):
+                habits = evaluate(chunk)
+                self.running.update(chunk, habits)
+                self.running_trends = update_trends(self.running_trends, chunk, habits)
+                part = cooccurrence(chunk)
+                self.running_cooccurrence = (part if self.running_cooccurrence is None
+                                             else merge_cooccurrence(self.running_cooccurrence, part))
+                self.pending = True
+                if self.data is None:
+                    self.data = chunk.iloc[:self.preview_rows].copy()
+        except Exception:
+            # A reload that failed halfway starts over next time; appended
+            # chunks folded in before the failure are published next time
+            if restart:
+                self.running = None
+            raise
+        if self.data is None:
+            self.data = apply_schema(pd.DataFrame(columns=self.source.header or []))
+        changed, self.pending = restart or self.pending, False
+        return changed
+
+    # The running aggregates keep changing with later chunks, so the published
+    # snapshot takes their result as of now. Before any chunk arrived (a sheet
+    # with just a header) they are built from the empty preview like from any
+    # other frame.
+    def _snapshot(self, version):
+        if self.running.cube is None:
+            return Snapshot(self.data, version, 0)
+        artifacts = {'cube': self.running.result(), 'trends': self.running_trends}
+        if self.running_cooccurrence is not None:
+            artifacts['associations'] = association_stats(self.running_cooccurrence)
+        return Snapshot(self.data, version, self.running.rows, artifacts)
+
+
+# Survey cache shared by the server processes of a deployment through
+# SHARED_DIR. One process at a time leads: it holds the directory's lock, syncs
+# the sheet like SheetCache and publishes every new version there along with
+# its cube. The others never call the Sheets API. They poll the manifest and
+# memory-map each new version zero-copy, so the data sits in memory once
+# however many processes there are. When the leader exits, the next process to
+# refresh takes over from the sync position of the latest snapshot.
+class SharedCache(SheetCache):
+    def __init__(self, source=None, ttl=CACHE_TTL, directory=SHARED_DIR, wait=SHARED_WAIT):
+        super().__init__(source, ttl, snapshots=True, snapshot_dir=directory)
+        self.leader = LeaderLock(directory)
+        self.wait = wait
+
+    def _update(self, prepare=None):
+        deadline = time.monotonic() + self.wait
+        while True:
+            if self.leader.acquire():
+                gauge('shared.leader', 1)
+                return super()._update(prepare)
+            gauge('shared.leader', 0)
+            self._follow(prepare)
+            if self.current.data is not None or time.monotonic() >= deadline:
+                break
+            time.sleep(0.5)
+        if self.current.data is None:
+            error = RuntimeError(f'no survey data was published in {self.snapshot_dir} yet')
+            self._failed(error)
+            raise error
+        self.last_error, self.failures = None, 0
+        self.expires_at = time.monotonic() + self.ttl
+
+    # Map the version the leader published last, if it is not the current one.
+    # Its sync position is kept so this process can take over as the leader.
+    def _follow(self, prepare=None):
+        version = latest_version(self.snapshot_dir)
+        if version is None or version == self.current.version:
+            return
+        with span('snapshot.map'):
+            data, meta = load_snapshot(version, self.snapshot_dir, zero_copy=True)
+        if data is None or not self.source.restore(meta['sync']):
+            return
+        count('shared.follow')
+        self.data, self.version, self.unpublished = data, version, 0
+        snapshot = Snapshot(data, version, artifacts=load_artifacts(version, self.snapshot_dir))
+        if prepare is not None:
+            prepare(snapshot)
+        self.current = snapshot
+        gauge('survey.rows', self.rows)
+        gauge('data.version', self.version)
+
+    # The cube, the trends and the associations go with the data, so the other
+    # processes don't build them again
+    def _save(self, snapshot):
+        save_snapshot(snapshot.data, snapshot.version, {'sync': self.source.state()}, self.snapshot_dir,
+                      artifacts={'cube': snapshot.cube(), 'trends': snapshot.trends(),
+                                 'associations': snapshot.associations()})
+
+
+if STREAMING:
+    sheet_cache = StreamingCache()
+elif SHARED_DIR:
+    sheet_cache = SharedCache()
+else:
+    sheet_cache = SheetCache(snapshots=SNAPSHOTS)
+
+
+def load_data():
+    return sheet_cache.get()
+
+
+def load_cube():
+    return sheet_cache.cube()
+
+
+def data_version():
+    return sheet_cache.current.version
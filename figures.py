@@ -0,0 +1,75 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import seaborn as sns
+from matplotlib.figure import Figure
+
+from instrumentation import count, span
+
+# Number of rendered chart images kept in memory
+FIGURE_CACHE_SIZE = int(os.environ.get('MEALMETRICS_FIGURE_CACHE_SIZE', '64'))
+
+
+# Bar chart of precomputed answer counts, labelled like sns.countplot
+def plot_counts(counts, ax=None, **kwargs):
+    ax = sns.barplot(x=counts.index.astype(str), y=counts.to_numpy(), ax=ax, **kwargs)
+    ax.set(xlabel=counts.name, ylabel='count')
+    return ax
+
+
+# Draw a countplot and return it as PNG/SVG bytes. The figure is created
+# without pyplot, so it never lands in pyplot's global registry, and it is
+# cleared as soon as the image has been saved.
+def render_counts(counts, palette=None, fmt='png'):
+    with span('figure.render') as details:
+        details['chart'] = counts.name
+        fig = Figure()
+        ax = fig.subplots()
+        plot_counts(counts, ax=ax, palette=palette)
+        ax.tick_params(axis='x', labelrotation=45)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=fmt, bbox_inches='tight', dpi=200)
+        fig.clear()
+        return buffer.getvalue()
+
+
+# Least recently used cache of rendered images, shared by every session
+class FigureCache:
+    def __init__(self, maxsize=FIGURE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, render):
+        with self._lock:
+            if key in self._images:
+                self.hits += 1
+                count('figure_cache.hit')
+                self._images.move_to_end(key)
+                return self._images[key]
+        self.misses += 1
+        count('figure_cache.miss')
+        image = render()
+        with self._lock:
+            self._images[key] = image
+            while len(self._images) > self.maxsize:
+                self._images.popitem(last=False)
+        return image
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+
+
+figure_cache = FigureCache()
+
+
+# Countplot image of `counts`. The cache key is the counts themselves, so a
+# chart is only drawn again once its numbers change.
+def countplot_image(counts, palette=None, fmt='png'):
+    key = (counts.name, palette, fmt, tuple(counts.index), tuple(counts.tolist()))
+    return figure_cache.get(key, lambda: render_counts(counts, palette, fmt))
@@ -0,0 +1,91 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from aggregates import build_cube
+from survey_schema import PRIORITIES_MASK, SOURCE, SURVEY_SCHEMA
+
+# Columns the PANEL charts can be filtered by
+FILTER_COLUMNS = os.environ.get('MEALMETRICS_FILTER_COLUMNS',
+                                'Gender,Dietary Preferences,Meal Frequency,Eating Out Frequency,Source').split(',')
+
+# Filtered cubes kept in memory
+FILTERED_CUBES = int(os.environ.get('MEALMETRICS_FILTERED_CUBES', '32'))
+
+
+# One packed bitmap per answer of every filter column: bit i of the bitmap of
+# an answer is set when respondent i gave it. Built once per data version; a
+# bitmap takes one bit per respondent, so millions of rows cost a few hundred
+# KB per answer.
+def build_index(data, columns=FILTER_COLUMNS):
+    index = {'rows': len(data), 'bitmaps': {}}
+    for column in columns:
+        if column not in data.columns:
+            continue
+        codes = data[column].cat.codes.to_numpy()
+        index['bitmaps'][column] = {answer: np.packbits(codes == code)
+                                    for code, answer in enumerate(data[column].cat.categories)}
+    return index
+
+
+# Respondents matching `filters` ({column: [answers]}) as a boolean mask, or
+# None when nothing is filtered. Answers of one column are OR-ed and columns
+# AND-ed, all on the packed bitmaps, so only the final bitmap is unpacked.
+def select(index, filters):
+    selected = None
+    for column, answers in filters.items():
+        bitmaps = index['bitmaps'][column]
+        matches = np.zeros((index['rows'] + 7) // 8, dtype=np.uint8)
+        for answer in answers:
+            if answer in bitmaps:
+                matches |= bitmaps[answer]
+        selected = matches if selected is None else selected & matches
+    if selected is None:
+        return None
+    return np.unpackbits(selected, count=index['rows']).view(bool)
+
+
+# Hashable form of `filters`, for caching
+def filter_key(filters):
+    return tuple(sorted((column, tuple(sorted(map(str, answers)))) for column, answers in filters.items() if answers))
+
+
+# The cube (or what `build` makes of the rows) of the respondents matching
+# `filters`. Only the survey columns are taken from the matching rows. Given
+# the `habits` of all the data, `build(rows, habits)` gets those of the
+# matching rows instead of evaluating them again.
+def filter_cube(data, index, filters, build=build_cube, habits=None):
+    mask = select(index, filters)
+    if mask is None:
+        return build(data) if habits is None else build(data, habits)
+    rows = np.flatnonzero(mask)
+    columns = [column for column in [*SURVEY_SCHEMA, SOURCE, PRIORITIES_MASK] if column in data.columns]
+    subset = data.iloc[rows, [data.columns.get_loc(column) for column in columns]]
+    subset.attrs = data.attrs
+    return build(subset) if habits is None else build(subset, habits.iloc[rows])
+
+
+# Least recently used filtered cubes, per data version and filter combination
+class FilteredCubes:
+    def __init__(self, maxsize=FILTERED_CUBES):
+        self.maxsize = maxsize
+        self._cubes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, version, filters, build):
+        key = (version, filter_key(filters))
+        with self._lock:
+            if key in self._cubes:
+                self._cubes.move_to_end(key)
+                return self._cubes[key]
+        cube = build()
+        with self._lock:
+            self._cubes[key] = cube
+            while len(self._cubes) > self.maxsize:
+                self._cubes.popitem(last=False)
+        return cube
+
+
+filtered_cubes = FilteredCubes()
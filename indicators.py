@@ -0,0 +1,99 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from survey_schema import SOURCE, SURVEY_SCHEMA
+
+# Indicators of healthy habits. Each one reads a single survey column and
+# tests its answers with one of the OPERATORS. A JSON file with a list of the
+# same dicts, named by MEALMETRICS_INDICATORS, replaces these.
+HEALTHY_INDICATORS = [
+    {'name': 'Nutritional Value Consideration', 'column': 'Nutritional Consideration',
+     'op': 'isin', 'values': ['Always', 'Often']},
+    {'name': 'Read Food Labels', 'column': 'Food Label Reading Habits', 'op': 'isin', 'values': ['Always', 'Often']},
+    {'name': 'Follow Diet Plan', 'column': 'Dietary Preferences', 'op': 'ne', 'values': 'No specific diet'},
+    {'name': 'High Fruits & Vegetables', 'column': 'Fruits and Vegetables Consumption',
+     'op': 'isin', 'values': ['51% - 75%', 'More than 75%']},
+    {'name': 'Frequent Whole Grains', 'column': 'Whole Grains Consumption',
+     'op': 'isin', 'values': ['Every meal', 'Most meals']},
+    {'name': 'Taking Steps to Improve Diet', 'column': 'Steps to Improve Diet', 'op': 'eq', 'values': 'Yes'},
+]
+
+# Whether an answer passes, and whether a missing answer does (as with the
+# pandas methods of the same name, only `ne` and `notin` accept it)
+OPERATORS = {
+    'isin': (lambda answer, values: answer in values, False),
+    'notin': (lambda answer, values: answer not in values, True),
+    'eq': (lambda answer, value: answer == value, False),
+    'ne': (lambda answer, value: answer != value, True),
+}
+
+# Column holding each respondent's number of healthy habits
+SCORE = 'Health Score'
+
+
+def load_indicators(path=None):
+    path = path or os.environ.get('MEALMETRICS_INDICATORS')
+    if not path:
+        return HEALTHY_INDICATORS
+    with open(path) as config:
+        indicators = json.load(config)
+    for indicator in indicators:
+        if indicator.get('op') not in OPERATORS:
+            raise ValueError(f'Unknown operator in indicator {indicator.get("name")!r}: {indicator.get("op")!r}')
+        if indicator.get('column') not in (*SURVEY_SCHEMA, SOURCE):
+            raise ValueError(f'Unknown column in indicator {indicator.get("name")!r}: {indicator.get("column")!r}')
+        # A string would be matched character by character
+        if indicator['op'] in ('isin', 'notin') and not isinstance(indicator.get('values'), list):
+            raise ValueError(f'Indicator {indicator.get("name")!r} needs a list of values for {indicator["op"]!r}')
+    return indicators
+
+
+INDICATORS = load_indicators()
+
+
+# Which indicators every respondent meets, plus their health score. Each
+# indicator is decided once per distinct answer, into a lookup table indexed by
+# the column's Categorical codes, so the rows are only touched by one take per
+# indicator. Indicators on columns the frame doesn't have are left out.
+def evaluate(data, indicators=INDICATORS):
+    habits = {}
+    for indicator in indicators:
+        if indicator['column'] not in data.columns:
+            continue
+        values = data[indicator['column']]
+        test, missing = OPERATORS[indicator['op']]
+        # The trailing entry is picked by the -1 code of missing answers
+        table = np.array([test(answer, indicator['values']) for answer in values.cat.categories] + [missing])
+        habits[indicator['name']] = table[values.cat.codes.to_numpy()]
+    habits = pd.DataFrame(habits, index=data.index)
+    habits[SCORE] = habits.sum(axis=1).astype(np.int8)
+    return habits
+
+
+# Add the habits of newly arrived responses to those of the earlier ones
+def update_habits(habits, rows):
+    return pd.concat([habits, evaluate(rows)])
+
+
+# How many respondents meet each indicator
+def indicator_counts(habits):
+    return habits.drop(columns=SCORE).sum().astype(np.int64)
+
+
+# Indicator counts per answer of a Categorical segment column
+def indicator_counts_by(habits, segment):
+    codes = segment.cat.codes.to_numpy()
+    answered = codes >= 0
+    size = len(segment.cat.categories)
+    counts = {name: np.bincount(codes[answered], weights=met[answered], minlength=size).astype(np.int64)
+              for name, met in habits.drop(columns=SCORE).items()}
+    return pd.DataFrame(counts, index=segment.cat.categories)
+
+
+# How many respondents have each health score, from 0 to the number of indicators
+def score_counts(habits):
+    counts = np.bincount(habits[SCORE].to_numpy(), minlength=habits.shape[1])
+    return pd.Series(counts, index=pd.RangeIndex(len(counts), name=SCORE))
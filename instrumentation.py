@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Set MEALMETRICS_STARTUP_REPORT=1 to show the startup timings in the sidebar
+STARTUP_REPORT = os.environ.get('MEALMETRICS_STARTUP_REPORT') == '1'
+
+# Set MEALMETRICS_DEBUG=1 to show the spans and counters of every rerun, and
+# the latency percentiles of the process, in the sidebar
+DEBUG_PANEL = os.environ.get('MEALMETRICS_DEBUG') == '1'
+
+# Export files: every rerun is appended to METRICS_JSONL as one JSON line, and
+# METRICS_PROM is rewritten in the Prometheus text format (e.g. for the node
+# exporter's textfile collector)
+METRICS_JSONL = os.environ.get('MEALMETRICS_METRICS_JSONL')
+METRICS_PROM = os.environ.get('MEALMETRICS_METRICS_PROM')
+
+# Latest durations kept per span for the percentiles
+METRICS_WINDOW = int(os.environ.get('MEALMETRICS_METRICS_WINDOW', '1000'))
+
+# The app imports this module first thing, so this is close to when the
+# worker started running it
+PROCESS_START = time.perf_counter()
+
+QUANTILES = [0.5, 0.9, 0.99]
+
+logger = logging.getLogger('mealmetrics')
+
+_startup = {}
+
+# Spans and counters of the rerun running on this thread; Streamlit runs every
+# session's script on its own thread
+_local = threading.local()
+
+
+# Time a one-off startup step, typically a lazy import. Only the first run is
+# recorded; later runs find the modules already imported.
+@contextmanager
+def startup_timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _startup.setdefault(name, time.perf_counter() - start)
+
+
+# Called at the end of every rerun; the first call marks the first paint
+def mark_first_paint():
+    if 'first paint' not in _startup:
+        _startup['first paint'] = time.perf_counter() - PROCESS_START
+        logger.info('startup: %s', ', '.join(f'{name} {seconds * 1000:.0f} ms'
+                                              for name, seconds in startup_report().items()))
+
+
+# Seconds spent in each recorded startup step
+def startup_report():
+    return dict(_startup)
+
+
+def _quantile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def _labels(labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped))
+
+
+# Process-wide span durations, counters and gauges, shared by every session.
+# Metrics are keyed by name plus an optional tuple of (label, value) pairs.
+class Metrics:
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.spans = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def observe(self, name, seconds, labels=()):
+        with self._lock:
+            span = self.spans.get((name, labels))
+            if span is None:
+                span = self.spans[(name, labels)] = {'count': 0, 'sum': 0.0, 'recent': deque(maxlen=self.window)}
+            span['count'] += 1
+            span['sum'] += seconds
+            span['recent'].append(seconds)
+
+    def inc(self, name, value=1, labels=()):
+        with self._lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    def set(self, name, value, labels=()):
+        with self._lock:
+            self.gauges[(name, labels)] = value
+
+    # Count, total and percentiles (over the recent window) of every span
+    def summary(self):
+        with self._lock:
+            spans = {key: (span['count'], span['sum'], list(span['recent'])) for key, span in self.spans.items()}
+        return [{'span': name, 'labels': dict(labels), 'count': count, 'sum': total,
+                 **{f'p{q * 100:g}': _quantile(recent, q) for q in QUANTILES}}
+                for (name, labels), (count, total, recent) in sorted(spans.items())]
+
+    def prometheus(self):
+        lines = ['# HELP mealmetrics_span_seconds Time spent in each instrumented stage',
+                 '# TYPE mealmetrics_span_seconds summary']
+        for span in self.summary():
+            labels = {'span': span['span'], **span['labels']}
+            for q in QUANTILES:
+                lines.append(f'mealmetrics_span_seconds{{{_labels({**labels, "quantile": q})}}} {span[f"p{q * 100:g}"]}')
+            lines.append(f'mealmetrics_span_seconds_sum{{{_labels(labels)}}} {span["sum"]}')
+            lines.append(f'mealmetrics_span_seconds_count{{{_labels(labels)}}} {span["count"]}')
+        with self._lock:
+            counters, gauges = sorted(self.counters.items()), sorted(self.gauges.items())
+        lines += ['# HELP mealmetrics_events_total Cache hits and misses and other events',
+                  '# TYPE mealmetrics_events_total counter']
+        lines += [f'mealmetrics_events_total{{{_labels({"event": name, **dict(labels)})}}} {value}'
+                  for (name, labels), value in counters]
+        lines += ['# HELP mealmetrics_value Row counts, data version and other current values',
+                  '# TYPE mealmetrics_value gauge']
+        lines += [f'mealmetrics_value{{{_labels({"name": name, **dict(labels)})}}} {value}'
+                  for (name, labels), value in gauges]
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+# Time a stage. The span is recorded in the process metrics and, during a
+# rerun, in the rerun's trace; details like row counts can be added to the
+# dict it yields and show up in the trace.
+@contextmanager
+def span(name, **labels):
+    trace = getattr(_local, 'trace', None)
+    depth = getattr(_local, 'depth', 0)
+    details = {}
+    _local.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        yield details
+    finally:
+        seconds = time.perf_counter() - start
+        _local.depth = depth
+        metrics.observe(name, seconds, tuple(labels.items()))
+        if trace is not None:
+            trace.append({'span': name, 'depth': depth, 'start': start - _local.start, 'ms': seconds * 1000,
+                          **labels, **details})
+
+
+# Wrap a function so every call is timed as a span
+def timed(name, function):
+    def run(*args, **kwargs):
+        with span(name):
+            return function(*args, **kwargs)
+    return run
+
+
+def count(name, value=1, **labels):
+    metrics.inc(name, value, tuple(labels.items()))
+    counters = getattr(_local, 'counters', None)
+    if counters is not None:
+        counters[name] = counters.get(name, 0) + value
+
+
+def gauge(name, value, **labels):
+    metrics.set(name, value, tuple(labels.items()))
+
+
+# Start collecting the spans and counters of a rerun on this thread
+def begin_rerun():
+    _local.trace = []
+    _local.counters = {}
+    _local.depth = 0
+    _local.start = time.perf_counter()
+
+
+# Close the rerun of `page`: its latency goes into the `rerun` span, and the
+# rerun is exported. Returns the rerun's trace.
+def end_rerun(page):
+    seconds = time.perf_counter() - _local.start
+    metrics.observe('rerun', seconds, (('page', page),))
+    record = {'time': time.time(), 'page': page, 'ms': seconds * 1000,
+              'spans': sorted(_local.trace, key=lambda entry: entry['start']), 'counters': _local.counters}
+    _local.trace = _local.counters = None
+    try:
+        export(record)
+    except OSError:
+        logger.exception('could not export metrics')
+    return record
+
+
+def export(record):
+    if METRICS_JSONL:
+        with open(METRICS_JSONL, 'a') as lines:
+            lines.write(json.dumps(record, default=str) + '\n')
+    if METRICS_PROM:
+        tmp = f'{METRICS_PROM}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w') as exposition:
+            exposition.write(metrics.prometheus())
+        os.replace(tmp, METRICS_PROM)
@@ -0,0 +1,104 @@
+import os
+import re
+
+import pandas as pd
+
+# Cell ranges like "A2:L", "A2:L100" or "1:1"
+_RANGE = re.compile(r"^(?:'?[^!]*'?!)?([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?$")
+
+
+def _col_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+
+# Trailing empty cells and rows are left out, like the Sheets API does
+def _trim(rows):
+    trimmed = []
+    for row in rows:
+        end = len(row)
+        while end and row[end - 1] == '':
+            end -= 1
+        trimmed.append(row[:end])
+    while trimmed and not trimmed[-1]:
+        trimmed.pop()
+    return trimmed
+
+
+# A worksheet backed by a local table instead of Google Sheets. It implements
+# the part of the gspread Worksheet API the loader uses, so a CSV or Parquet
+# export can stand in for client.open('mealmetrics_data').sheet1 when running
+# offline, in tests or in benchmarks.
+class LocalWorksheet:
+    def __init__(self, frame, title='Sheet1'):
+        self.title = title
+        self.header = [str(column) for column in frame.columns]
+        # Cell values as the sheet would display them
+        self.frame = frame.fillna('').astype(str)
+
+    @classmethod
+    def from_file(cls, path):
+        if path.endswith('.csv'):
+            frame = pd.read_csv(path, dtype=str, keep_default_na=False)
+        else:
+            frame = pd.read_parquet(path)
+        return cls(frame, title=os.path.splitext(os.path.basename(path))[0])
+
+    @property
+    def row_count(self):
+        return len(self.frame) + 1
+
+    @property
+    def col_count(self):
+        return len(self.header)
+
+    def get_all_values(self):
+        return [self.header[:]] + self.frame.values.tolist()
+
+    def get_all_records(self):
+        return self.frame.to_dict(orient='records')
+
+    def row_values(self, row):
+        values = self.get(f'{row}:{row}')
+        return values[0] if values else []
+
+    # Values of a range, the whole sheet by default. With major_dimension
+    # 'COLUMNS' every inner list holds one column instead of one row.
+    def get(self, range_name=None, major_dimension='ROWS'):
+        range_name = range_name or ''
+        first_col, first_row, last_col, last_row = _RANGE.match(range_name).groups()
+        if ':' not in range_name:
+            last_col, last_row = first_col, first_row
+        first_row = int(first_row or 1)
+        last_row = int(last_row) if last_row else self.row_count
+        first_col = _col_number(first_col) if first_col else 1
+        last_col = _col_number(last_col) if last_col else self.col_count
+        # Row 1 is the header, data rows start on row 2
+        header = [self.header[first_col - 1:last_col]] if first_row == 1 else []
+        rows = self.frame.iloc[max(first_row - 2, 0):last_row - 1, first_col - 1:last_col]
+        if major_dimension == 'COLUMNS':
+            names = header[0] if header else [None] * rows.shape[1]
+            return _trim([([name] if header else []) + column
+                          for name, column in zip(names, rows.T.values.tolist())])
+        return _trim(header + rows.values.tolist())
+
+    def batch_get(self, ranges, major_dimension='ROWS'):
+        return [self.get(range_name, major_dimension) for range_name in ranges]
+
+    def append_rows(self, rows):
+        rows = pd.DataFrame([[str(value) for value in row] for row in rows])
+        rows.columns = self.frame.columns[:rows.shape[1]]
+        self.frame = pd.concat([self.frame, rows], ignore_index=True).fillna('')
+
+
+_opened = {}
+
+
+# Open a local file as a worksheet, reading it again only when it changes
+def open_local(path):
+    mtime = os.path.getmtime(path)
+    if path not in _opened or _opened[path][0] != mtime:
+        _opened[path] = (mtime, LocalWorksheet.from_file(path))
+    return _opened[path][1]
@@ -0,0 +1,63 @@
+from collections import namedtuple
+
+from instrumentation import span
+
+Page = namedtuple('Page', ['name', 'icon', 'needs', 'render'])
+Provider = namedtuple('Provider', ['name', 'needs', 'static', 'build'])
+
+_pages = {}
+_providers = {}
+_static = {}
+
+
+# Register a page. `needs` names the providers whose results are passed to the
+# page function as keyword arguments; nothing else is loaded for the page.
+def page(name, icon=None, needs=()):
+    def register(render):
+        _pages[name] = Page(name, icon, tuple(needs), render)
+        return render
+    return register
+
+
+# Register something pages can depend on: the raw frame, aggregates, static
+# chart data, ... Providers can depend on other providers. Static providers are
+# built once per process, the others once per rerun (and are expected to do
+# their own caching across reruns, e.g. per data version).
+def provider(name, needs=(), static=False):
+    def register(build):
+        _providers[name] = Provider(name, tuple(needs), static, build)
+        return build
+    return register
+
+
+def page_names():
+    return list(_pages)
+
+
+def page_icons():
+    return [page.icon for page in _pages.values()]
+
+
+# Render a page, resolving only the dependencies it declared
+def render(name):
+    resolved = {}
+
+    def resolve(dependency):
+        if dependency in resolved:
+            return resolved[dependency]
+        spec = _providers[dependency]
+        if spec.static and dependency in _static:
+            value = _static[dependency]
+        else:
+            needs = {need: resolve(need) for need in spec.needs}
+            with span('provider', provider=dependency):
+                value = spec.build(**needs)
+            if spec.static:
+                _static[dependency] = value
+        resolved[dependency] = value
+        return value
+
+    spec = _pages[name]
+    needs = {need: resolve(need) for need in spec.needs}
+    with span('page', page=name):
+        spec.render(**needs)
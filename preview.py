@@ -0,0 +1,41 @@
+import numpy as np
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+
+# Columns shown in the data preview: everything after the timestamp and the
+# respondent columns, minus the internal encoded ones
+def preview_columns(data):
+    return [column for column in data.columns[2:] if not column.startswith('_')]
+
+
+# Row positions of `data` sorted by `column`, missing values last. This is the
+# only full scan of a sort, so callers cache it per data version.
+def sort_order(data, column, ascending=True):
+    values = data[column].sort_values(ascending=ascending, kind='stable', na_position='last')
+    return values.index.to_numpy()
+
+
+# Rows whose `column` holds one of `values`, as a boolean mask. On Categorical
+# columns this compares integer codes only.
+def filter_mask(data, column, values):
+    return data[column].isin(values).to_numpy()
+
+
+# Row positions in display order, after an optional sort and filter. None
+# means the sheet order with nothing filtered out.
+def preview_rows(order=None, mask=None):
+    if mask is None:
+        return order
+    if order is None:
+        return np.flatnonzero(mask)
+    return order[mask[order]]
+
+
+# One page of the preview. Only the rows and columns on the page are copied,
+# so the cost is the same however big the sheet grows.
+def preview_page(data, columns, rows, page, page_size):
+    start = page * page_size
+    page_rows = slice(start, start + page_size) if rows is None else rows[start:start + page_size]
+    column_positions = [data.columns.get_loc(column) for column in columns]
+    return data.iloc[page_rows, column_positions]
@@ -0,0 +1,91 @@
+import logging
+import os
+import threading
+
+from instrumentation import count, span
+
+# Seconds between two background refreshes of the survey data. Set to 0 to
+# refresh in the rerun that finds the data expired instead.
+REFRESH_INTERVAL = float(os.environ.get('MEALMETRICS_REFRESH_INTERVAL', '60'))
+
+logger = logging.getLogger('mealmetrics')
+
+
+# Build what the pages read on a new snapshot before it is published, so the
+# first rerun after a refresh doesn't build it either. Filters only apply to
+# snapshots holding the whole sheet, not to a streaming preview.
+def warm_up(snapshot):
+    from filters import build_index
+
+    snapshot.cube()
+    snapshot.trends()
+    snapshot.associations()
+    if snapshot.rows == len(snapshot.data):
+        snapshot.habits()
+        snapshot.artifact('filter index', build_index)
+
+
+# Keeps a SheetCache up to date from a daemon thread. Every `interval` seconds
+# the sheet is synced, which only fetches the header and the rows from the last
+# ingested one on, and when something changed the next snapshot is built,
+# warmed up and swapped in. Reruns keep reading the previous snapshot meanwhile.
+class Refresher:
+    def __init__(self, cache, interval=REFRESH_INTERVAL, prepare=warm_up):
+        self.cache = cache
+        self.interval = interval
+        self.prepare = prepare
+        self.thread = None
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self.thread is None:
+            self.cache.background = True
+            self.thread = threading.Thread(target=self._run, name='survey-refresh', daemon=True)
+            self.thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopped.is_set():
+            wait = self.interval
+            try:
+                with span('refresher.update'):
+                    self.cache.update(self.prepare)
+            except Exception as error:
+                # The last published snapshot is still served; try again once
+                # the cache's cooldown is over. Failed fetches are logged by
+                # the cache itself.
+                count('refresher.error')
+                if error is not self.cache.last_error:
+                    logger.exception('could not prepare the survey data')
+                wait = max(wait, self.cache.retry_in())
+            self._wake.wait(wait)
+            self._wake.clear()
+
+    # Refresh now rather than at the end of the interval
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        self.cache.background = False
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+# Start the process-wide refresher of `cache`, once; a refresher of another
+# cache is stopped. Returns None when background refreshes are turned off.
+def keep_fresh(cache, interval=REFRESH_INTERVAL):
+    global _refresher
+
+    if interval <= 0:
+        return None
+    with _refresher_lock:
+        if _refresher is None or _refresher.cache is not cache:
+            if _refresher is not None:
+                _refresher.stop()
+            _refresher = Refresher(cache, interval).start()
+        return _refresher
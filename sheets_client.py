@@ -0,0 +1,180 @@
+import datetime
+import logging
+import os
+import random
+import threading
+import time
+
+from instrumentation import count, span
+
+# Define the scope
+SCOPE = ["https://spreadsheets.google.com/feeds", 'https://www.googleapis.com/auth/spreadsheets',
+         "https://www.googleapis.com/auth/drive.file", "https://www.googleapis.com/auth/drive"]
+
+# Service account key used to authorize with Google
+KEYFILE = os.environ.get('MEALMETRICS_KEYFILE', 'proven-yen-409211-2ee88f35110a.json')
+
+# The access token is renewed in the background this many seconds before it
+# expires, so no request ever waits for a token refresh
+TOKEN_REFRESH_MARGIN = float(os.environ.get('MEALMETRICS_TOKEN_REFRESH_MARGIN', '300'))
+
+# Kept-alive HTTPS connections to the Google APIs, per host
+HTTP_POOL_SIZE = int(os.environ.get('MEALMETRICS_HTTP_POOL_SIZE', '10'))
+
+# A Sheets API call rejected for quota (HTTP 429) or by a transient server
+# error is retried this many times, after exponentially growing delays
+RETRIES = int(os.environ.get('MEALMETRICS_SHEETS_RETRIES', '4'))
+BACKOFF_BASE = float(os.environ.get('MEALMETRICS_BACKOFF_BASE', '1'))
+BACKOFF_MAX = float(os.environ.get('MEALMETRICS_BACKOFF_MAX', '32'))
+
+logger = logging.getLogger('mealmetrics')
+
+
+# Whether a failed call is worth retrying: gspread's APIError (like the
+# requests errors) carries the HTTP response. Older quota errors came back as
+# 403 rateLimitExceeded.
+def retryable(error):
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status is None:
+        return False
+    return status == 429 or status >= 500 or (status == 403 and 'ratelimitexceeded' in str(error).lower())
+
+
+# Delay before retry number `attempt` (from 0): exponential, capped, with half
+# of it random so that sessions rejected together don't retry together
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+# Seconds the server asked us to wait, if it did
+def retry_after(error):
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After', 0))
+    except ValueError:
+        return 0
+
+
+# Call a Sheets API method, backing off and retrying while it is rate limited
+def with_backoff(call, *args, retries=RETRIES, **kwargs):
+    for attempt in range(retries + 1):
+        try:
+            return call(*args, **kwargs)
+        except Exception as error:
+            if attempt == retries or not retryable(error):
+                raise
+            delay = max(backoff_delay(attempt), retry_after(error))
+            count('sheets.retry')
+            logger.warning('Sheets API call failed (%s), retrying in %.1f s', error, delay)
+            time.sleep(delay)
+
+
+# One authorized gspread client per process, shared by every session and by
+# the analysis script. The key file is read and the client authorized once;
+# after that the same token and the same pool of HTTP connections serve every
+# request, and opened worksheets are remembered so they aren't looked up in
+# Drive again.
+class SheetsClient:
+    def __init__(self, keyfile=KEYFILE, scope=SCOPE, refresh_margin=TOKEN_REFRESH_MARGIN, pool_size=HTTP_POOL_SIZE,
+                 background=True):
+        self.keyfile = keyfile
+        self.scope = scope
+        self.refresh_margin = refresh_margin
+        self.pool_size = pool_size
+        self.background = background
+        self.client = None
+        self._worksheets = {}
+        self._lock = threading.RLock()
+        self._refresher = None
+        self._stopped = threading.Event()
+
+    def _authorize(self):
+        import gspread
+        from oauth2client.service_account import ServiceAccountCredentials
+        from requests.adapters import HTTPAdapter
+
+        with span('sheets.auth'):
+            creds = ServiceAccountCredentials.from_json_keyfile_name(self.keyfile, self.scope)
+            client = gspread.authorize(creds)
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            client.session.mount('https://', adapter)
+        return client
+
+    def get_client(self):
+        with self._lock:
+            if self.client is None:
+                self.client = self._authorize()
+                if self.background and self._refresher is None:
+                    self._refresher = threading.Thread(target=self._keep_token_fresh, name='sheets-token-refresh',
+                                                       daemon=True)
+                    self._refresher.start()
+            return self.client
+
+    # Open a worksheet (the first one by default) of a spreadsheet, reusing the
+    # handle from earlier calls. The lock is not held while the sheet is opened,
+    # which can back off for a while, so sheets open concurrently; when two
+    # threads open the same one, the first handle is kept.
+    def worksheet(self, spreadsheet, title=None):
+        key = (spreadsheet, title)
+        with self._lock:
+            if key in self._worksheets:
+                count('sheets.worksheet_reused')
+                return self._worksheets[key]
+        client = self.get_client()
+        with span('sheets.open'):
+            opened = with_backoff(client.open, spreadsheet)
+            sheet = opened.sheet1 if title is None else with_backoff(opened.worksheet, title)
+        with self._lock:
+            # A handle of a client dropped by reset() meanwhile is not kept
+            if self.client is not client:
+                return sheet
+            return self._worksheets.setdefault(key, sheet)
+
+    # Seconds until the token is due for renewal; 0 if there is no token yet
+    def _refresh_in(self):
+        if self.client is None:
+            return self.refresh_margin
+        expiry = self.client.auth.expiry
+        if not expiry:
+            return 0
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return max((expiry - now).total_seconds() - self.refresh_margin, 0)
+
+    # Renew the access token through a plain request of its own: going through
+    # the authorized session would bypass that session's own refresh lock.
+    # Sessions keep using the current token meanwhile.
+    def refresh_token(self):
+        from google.auth.transport.requests import Request
+
+        client = self.client
+        if client is None:
+            return
+        with span('sheets.token_refresh'):
+            client.auth.refresh(Request())
+
+    def _keep_token_fresh(self):
+        while not self._stopped.wait(self._refresh_in()):
+            try:
+                self.refresh_token()
+            except Exception:
+                # The session still refreshes the token on demand; try again later
+                logger.exception('could not refresh the Sheets access token')
+                self._stopped.wait(60)
+
+    # Drop the client and the opened worksheets, e.g. after the key was rotated
+    def reset(self):
+        with self._lock:
+            self.client = None
+            self._worksheets.clear()
+
+    def close(self):
+        self._stopped.set()
+        with self._lock:
+            if self.client is not None:
+                self.client.session.close()
+            self.reset()
+
+
+sheets_client = SheetsClient()
@@ -0,0 +1,221 @@
+import json
+import os
+import re
+import stat
+import time
+
+import pandas as pd
+
+# Directory holding the versioned snapshots of the ingested sheet, and how many
+# of them to keep around
+SNAPSHOT_DIR = os.environ.get('MEALMETRICS_SNAPSHOT_DIR', '.mealmetrics')
+SNAPSHOT_KEEP = int(os.environ.get('MEALMETRICS_SNAPSHOT_KEEP', '3'))
+
+_SNAPSHOT_NAME = re.compile(r'^snapshot-(\d+)\.arrow$')
+_META_KEY = b'mealmetrics'
+# Names the version published last; rewritten once its files are in place
+_MANIFEST = 'latest.json'
+
+
+def _snapshot_path(version, directory):
+    return os.path.join(directory, f'snapshot-{version:06d}.arrow')
+
+
+# Aggregates saved along with a snapshot, so readers don't rebuild them
+def _artifacts_path(version, directory):
+    return os.path.join(directory, f'snapshot-{version:06d}.artifacts.arrow')
+
+
+# Snapshot directories may sit somewhere shared, such as /dev/shm, and every
+# server process loads what is in them. Only directories that belong to the
+# user running the app are used, and group and others lose write access to
+# them (a directory made under a umask like 002 has it). With `create`, a
+# missing directory is created readable by this user only.
+def _check_directory(directory, create=False):
+    if create:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not hasattr(os, 'getuid') or not os.path.isdir(directory):
+        return
+    info = os.stat(directory)
+    if info.st_uid != os.getuid():
+        raise PermissionError(f'{directory} must belong to the user running the app')
+    if info.st_mode & 0o022:
+        os.chmod(directory, stat.S_IMODE(info.st_mode) & ~0o022)
+
+
+def _write_atomic(path, write):
+    with open(path + '.tmp', 'wb') as file:
+        write(file)
+    os.replace(path + '.tmp', path)
+
+
+def snapshot_versions(directory=SNAPSHOT_DIR):
+    if not os.path.isdir(directory):
+        return []
+    names = (_SNAPSHOT_NAME.match(name) for name in os.listdir(directory))
+    return sorted(int(match.group(1)) for match in names if match)
+
+
+# Arrow needs one type per column, but numericised sheet values can mix numbers
+# and text in the same column
+def _arrow_safe(data):
+    mixed = [column for column in data.columns
+             if data[column].dtype == object and pd.api.types.infer_dtype(data[column]).startswith('mixed')]
+    return data.astype({column: str for column in mixed}) if mixed else data
+
+
+# Artifacts are dicts of dicts of Series, DataFrames and plain values. They are
+# stored as one Arrow table with one row per Series or DataFrame, each one
+# serialised as an Arrow IPC stream. Their layout goes in the schema metadata
+# as JSON, so loading them never runs code from the file.
+def _encode_artifacts(artifacts):
+    import pyarrow as pa
+
+    tables = []
+
+    def encode(value):
+        if isinstance(value, dict):
+            return {'dict': [[key, encode(item)] for key, item in value.items()]}
+        if isinstance(value, (pd.Series, pd.DataFrame)):
+            frame = value.to_frame('_values') if isinstance(value, pd.Series) else value
+            table = pa.Table.from_pandas(frame, preserve_index=True)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            tables.append(sink.getvalue().to_pybytes())
+            if isinstance(value, pd.Series):
+                return {'series': len(tables) - 1, 'name': value.name}
+            return {'frame': len(tables) - 1}
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return {'value': value}
+        raise TypeError(f'cannot save a {type(value).__name__} artifact')
+
+    layout = encode(artifacts)
+    table = pa.table({'table': pa.array(tables, type=pa.binary())})
+    return table.replace_schema_metadata({_META_KEY: json.dumps(layout)})
+
+
+def _decode_artifacts(table):
+    import pyarrow as pa
+
+    def decode(node):
+        if 'dict' in node:
+            return {key: decode(item) for key, item in node['dict']}
+        if 'value' in node:
+            return node['value']
+        stream = table['table'][node['frame'] if 'frame' in node else node['series']].as_py()
+        frame = pa.ipc.open_stream(stream).read_all().to_pandas()
+        return frame['_values'].rename(node['name']) if 'series' in node else frame
+
+    return decode(json.loads(table.schema.metadata[_META_KEY]))
+
+
+def _write_table(path, table):
+    import pyarrow as pa
+
+    with pa.OSFile(path + '.tmp', 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(path + '.tmp', path)
+
+
+# Write `data` as an Arrow IPC file, with `artifacts` (e.g. the cube) next to
+# it. Files are written next to their final name and renamed into place, and
+# the manifest only names the version once all of them are, so readers never
+# see a half-written snapshot.
+def save_snapshot(data, version, meta=None, directory=SNAPSHOT_DIR, artifacts=None):
+    import pyarrow as pa
+
+    _check_directory(directory, create=True)
+    if artifacts:
+        _write_table(_artifacts_path(version, directory), _encode_artifacts(artifacts))
+    table = pa.Table.from_pandas(_arrow_safe(data), preserve_index=False)
+    meta = dict(meta or {}, version=version, saved_at=time.time(), attrs=data.attrs)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), _META_KEY: json.dumps(meta)})
+
+    path = _snapshot_path(version, directory)
+    _write_table(path, table)
+    _write_atomic(os.path.join(directory, _MANIFEST),
+                  lambda file: file.write(json.dumps({'version': version, 'saved_at': meta['saved_at']}).encode()))
+
+    # The version just saved is kept even when older numbered ones are on disk
+    for old in snapshot_versions(directory)[:-SNAPSHOT_KEEP]:
+        if old == version:
+            continue
+        prefix = f'snapshot-{old:06d}.'
+        for name in os.listdir(directory):
+            if name.startswith(prefix):
+                os.remove(os.path.join(directory, name))
+    return path
+
+
+# The version saved last, from the manifest; cheap enough to poll
+def latest_version(directory=SNAPSHOT_DIR):
+    try:
+        with open(os.path.join(directory, _MANIFEST)) as manifest:
+            return json.load(manifest)['version']
+    except (OSError, ValueError, KeyError):
+        versions = snapshot_versions(directory)
+        return versions[-1] if versions else None
+
+
+# Memory-map a snapshot (the latest one by default). Returns (data, meta), or
+# (None, None) when there is nothing to load. With `zero_copy` the columns
+# stay in the mapped file wherever pandas allows it: Categorical codes and
+# numbers as views of it, text as Arrow-backed strings. Processes mapping the
+# same file then share one copy of the data in memory.
+def load_snapshot(version=None, directory=SNAPSHOT_DIR, zero_copy=False):
+    import pyarrow as pa
+
+    _check_directory(directory)
+    versions = snapshot_versions(directory)
+    if version is None and versions:
+        version = versions[-1]
+    if version not in versions:
+        return None, None
+    with pa.memory_map(_snapshot_path(version, directory)) as source:
+        table = pa.ipc.open_file(source).read_all()
+    meta = json.loads(table.schema.metadata[_META_KEY])
+    if zero_copy:
+        strings = {pa.string(): pd.StringDtype('pyarrow'), pa.large_string(): pd.StringDtype('pyarrow')}
+        data = table.to_pandas(split_blocks=True, types_mapper=strings.get)
+    else:
+        data = table.to_pandas()
+    data.attrs.update(meta.get('attrs', {}))
+    return data, meta
+
+
+# The artifacts saved with a snapshot, or an empty dict
+def load_artifacts(version, directory=SNAPSHOT_DIR):
+    import pyarrow as pa
+
+    _check_directory(directory)
+    try:
+        with pa.memory_map(_artifacts_path(version, directory)) as source:
+            return _decode_artifacts(pa.ipc.open_file(source).read_all())
+    except FileNotFoundError:
+        return {}
+
+
+# Exclusive lock on a snapshot directory, held by the one process that syncs
+# the sheet for all the processes reading the directory. It is only released
+# when that process exits, and then another one can take it.
+class LeaderLock:
+    def __init__(self, directory=SNAPSHOT_DIR):
+        self.path = os.path.join(directory, 'leader.lock')
+        self._file = None
+
+    # Whether this process leads, taking the lock if it is free
+    def acquire(self):
+        import fcntl
+
+        if self._file is None:
+            _check_directory(os.path.dirname(self.path), create=True)
+            lock = open(self.path, 'a')
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                return False
+            self._file = lock
+        return True
@@ -0,0 +1,194 @@
+import numpy as np
+import pandas as pd
+
+# Answer scales used by several questions, lowest first
+FREQUENCY = ['Never', 'Rarely', 'Sometimes', 'Often', 'Always']
+SHARE_OF_MEALS = ['Less than 25%', '25% - 50%', '51% - 75%', 'More than 75%']
+MEALS_WITH = ['Never', 'Rarely', 'Some meals', 'Most meals', 'Every meal']
+
+# Declared categories for every single-choice survey column, as
+# (categories, ordered). Ordinal answers become ordered Categoricals so they
+# compare and sort by meaning, e.g. 'Often' < 'Always' and
+# '51% - 75%' < 'More than 75%'. Answers that are not declared here are kept
+# and placed after the declared ones, and declared answers nobody gave are left
+# out so charts don't grow empty bars.
+SURVEY_SCHEMA = {
+    'Gender': (['Male', 'Female', 'Other', 'Prefer not to say'], False),
+    'Dietary Preferences': (['No specific diet', 'Vegetarian', 'Non-vegetarian', 'Eggetarian', 'Vegan',
+                             'Pescatarian', 'Keto', 'Paleo', 'Gluten-free'], False),
+    'Meal Frequency': (['1 meal', '2 meals', '3 meals', '4 meals', '5 or more meals'], True),
+    'Nutritional Consideration': (FREQUENCY, True),
+    'Fruits and Vegetables Consumption': (SHARE_OF_MEALS, True),
+    'Whole Grains Consumption': (MEALS_WITH, True),
+    'Snacking Habits': (FREQUENCY, True),
+    'Eating Out Frequency': (['Never', 'Rarely', '1-2 times a week', '3-4 times a week',
+                              '5 or more times a week'], True),
+    'Food Label Reading Habits': (FREQUENCY, True),
+    'Steps to Improve Diet': (['No', 'Yes'], False),
+    'Health Consciousness': (['1', '2', '3', '4', '5'], True),
+    'Food Preference': ([], False),
+}
+
+
+# Multi-select question, stored as a comma separated list of options. Its
+# answers are also encoded as one bitmask per respondent, with bit i set when
+# option i of the frame's option vocabulary was picked.
+PRIORITIES = 'Food Selection Priorities'
+PRIORITIES_MASK = '_priorities_mask'
+
+# Known options of the priorities question, in bit order. Options found in the
+# data are appended to a frame's vocabulary, so existing bits never move.
+PRIORITY_OPTIONS = ['Taste', 'Cost', 'Health benefits', 'Convenience']
+
+# Column telling which source (survey wave, region, ...) a response came from
+# when several sheets are merged
+SOURCE = 'Source'
+
+
+# Declared answers that occur in `labels`, followed by the undeclared ones.
+# Columns outside the schema, such as the SOURCE, keep their labels in order.
+def categories_for(column, labels):
+    if column not in SURVEY_SCHEMA:
+        return list(dict.fromkeys(label for label in labels if label != ''))
+    declared = SURVEY_SCHEMA[column][0]
+    seen = {label for label in labels if label != ''}
+    extra = sorted(seen.difference(declared))
+    return [label for label in declared if label in seen] + extra
+
+
+# Encode raw sheet values as a Categorical. Values are hashed once with
+# factorize and only the distinct answers are turned into labels; blank answers
+# become missing values.
+def encode_column(column, values, categories=None):
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    labels = [str(value) for value in uniques]
+    if categories is None:
+        categories = categories_for(column, labels)
+    indexer = pd.Index(categories, dtype=object).get_indexer(labels)
+    # factorize marks missing values with -1, which picks the trailing -1 here
+    codes = np.append(indexer, -1)[codes]
+    return pd.Categorical.from_codes(codes, categories=categories, ordered=SURVEY_SCHEMA[column][1])
+
+
+# Option vocabulary the priorities bitmask of `data` was encoded with
+def priority_options(data):
+    return data.attrs.get('priority_options', PRIORITY_OPTIONS)
+
+
+# Encode multi-select answers as uint64 bitmasks. Only the distinct answer
+# combinations are split into options; every respondent then just picks up the
+# mask of their combination. Returns the masks and the (possibly extended)
+# option vocabulary.
+def encode_priorities(values, options=PRIORITY_OPTIONS):
+    options = list(options)
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    masks = np.zeros(len(uniques) + 1, dtype=np.uint64)
+    for i, answer in enumerate(uniques):
+        for option in str(answer).split(', '):
+            if option == '':
+                continue
+            if option not in options:
+                options.append(option)
+            masks[i] |= np.uint64(1) << np.uint64(options.index(option))
+    if len(options) > 64:
+        raise ValueError(f'{PRIORITIES} has {len(options)} options, at most 64 fit in the bitmask')
+    return masks[codes], options
+
+
+# Re-encode bitmasks over the `options` vocabulary as bitmasks over `target`,
+# which holds every option of `options`. Only the distinct masks are remapped.
+def remap_priorities(masks, options, target):
+    if list(options) == list(target)[:len(options)]:
+        return masks
+    uniques, inverse = np.unique(masks, return_inverse=True)
+    remapped = np.zeros(len(uniques), dtype=np.uint64)
+    for bit, option in enumerate(options):
+        remapped |= ((uniques >> np.uint64(bit)) & np.uint64(1)) << np.uint64(target.index(option))
+    return remapped[inverse]
+
+
+# Convert every survey column in `data` to its declared Categorical
+def apply_schema(data):
+    encoded = {}
+    for column in SURVEY_SCHEMA:
+        if column not in data.columns:
+            continue
+        values = data[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories = categories_for(column, values.cat.categories)
+            encoded[column] = values.cat.set_categories(categories, ordered=SURVEY_SCHEMA[column][1])
+        else:
+            encoded[column] = encode_column(column, values)
+    options = priority_options(data)
+    if PRIORITIES in data.columns and PRIORITIES_MASK not in data.columns:
+        encoded[PRIORITIES_MASK], options = encode_priorities(data[PRIORITIES], options)
+    data = data.assign(**encoded)
+    data.attrs['priority_options'] = options
+    return data
+
+
+# Append freshly ingested rows to an already encoded frame. The existing codes
+# are only remapped when the new rows bring answers never seen before.
+def append_rows(data, rows):
+    encoded = {}
+    for column in SURVEY_SCHEMA:
+        if column not in rows.columns:
+            continue
+        current = data[column].cat.categories
+        labels = [str(value) for value in pd.unique(rows[column])]
+        categories = categories_for(column, list(current) + labels)
+        if list(current) != categories:
+            data = data.assign(**{column: data[column].cat.set_categories(categories)})
+        encoded[column] = encode_column(column, rows[column], categories)
+    options = priority_options(data)
+    if PRIORITIES in rows.columns:
+        encoded[PRIORITIES_MASK], options = encode_priorities(rows[PRIORITIES], options)
+    data = pd.concat([data, rows.assign(**encoded)], ignore_index=True)
+    data.attrs['priority_options'] = options
+    return data
+
+
+# Stack the encoded frames of several sources ({label: frame}) into one, tagged
+# with the SOURCE column. Columns are the union of every source's columns;
+# survey columns get the union of their answers, and priority bitmasks are
+# re-encoded over the union of the option vocabularies.
+def merge_sources(parts):
+    columns, options = [], list(PRIORITY_OPTIONS)
+    for part in parts.values():
+        columns += [column for column in part.columns if column not in columns and column != SOURCE]
+        options += [option for option in priority_options(part) if option not in options]
+    if len(options) > 64:
+        raise ValueError(f'{PRIORITIES} has {len(options)} options, at most 64 fit in the bitmask')
+    categories = {column: categories_for(column, [answer for part in parts.values() if column in part.columns
+                                                  for answer in part[column].cat.categories])
+                  for column in SURVEY_SCHEMA if column in columns}
+
+    aligned = []
+    for part in parts.values():
+        encoded = {}
+        for column, answers in categories.items():
+            if column in part.columns:
+                encoded[column] = part[column].cat.set_categories(answers)
+            else:
+                encoded[column] = pd.Categorical.from_codes(np.full(len(part), -1), categories=answers,
+                                                            ordered=SURVEY_SCHEMA[column][1])
+        if PRIORITIES_MASK in columns:
+            encoded[PRIORITIES_MASK] = (remap_priorities(part[PRIORITIES_MASK].to_numpy(), priority_options(part), options)
+                                        if PRIORITIES_MASK in part.columns else np.zeros(len(part), dtype=np.uint64))
+        aligned.append(part.assign(**encoded).reindex(columns=columns))
+
+    data = pd.concat(aligned, ignore_index=True) if aligned else pd.DataFrame(columns=columns)
+    lengths = [len(part) for part in parts.values()]
+    data[SOURCE] = pd.Categorical.from_codes(np.repeat(np.arange(len(parts)), lengths), categories=list(parts))
+    data.attrs['priority_options'] = options
+    return data
+
+
+# The frames merge_sources() was built from, back out of the merged frame
+def split_sources(data):
+    parts = {}
+    for label in data[SOURCE].cat.categories:
+        part = data[data[SOURCE] == label].drop(columns=SOURCE).reset_index(drop=True)
+        part.attrs = dict(data.attrs)
+        parts[label] = part
+    return parts
@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from aggregates import breakdown, priority_counts_by
+from indicators import SCORE, evaluate, indicator_counts_by
+from survey_schema import PRIORITIES_MASK, SURVEY_SCHEMA
+
+# Column holding the form submission time, and how Google Forms writes it
+TIMESTAMP = 'Timestamp'
+TIMESTAMP_FORMAT = os.environ.get('MEALMETRICS_TIMESTAMP_FORMAT', '%m/%d/%Y %H:%M:%S')
+
+# Bucket sizes trends can be resampled to, as pandas offsets. Weeks start on
+# Monday and are labelled by it, months by their first day.
+FREQUENCIES = {'Daily': 'D', 'Weekly': 'W-MON', 'Monthly': 'MS'}
+
+# Name of the day column added while counting
+_DAY = '_day'
+
+
+# Day of every response, as a Categorical over the days present. Responses
+# share a few hundred days, so only the distinct dates are parsed rather than
+# every timestamp. Timestamps that can't be read get no day.
+def response_days(data):
+    date_format = TIMESTAMP_FORMAT.split(' ', 1)[0]
+    codes, dates = pd.factorize([str(stamp).split(' ', 1)[0] for stamp in data[TIMESTAMP]])
+    days = pd.to_datetime(pd.Index(dates, dtype=object), format=date_format, errors='coerce')
+    return pd.Categorical(days[codes])
+
+
+# Everything the trends charts read, per day of submission:
+#   trends['responses']          responses per day
+#   trends['answers'][column]    answers of each survey column per day
+#   trends['priorities']         food selection priorities picked per day
+#   trends['healthy']            respondents meeting each healthy habit indicator per day
+#   trends['scores']             sum of the health scores of the day's respondents
+#   trends['undated']            responses whose timestamp could not be read
+# Every table is indexed by day, so trends of separate rows add up. None when
+# the sheet has no timestamp column. `habits` is evaluate(data), when the
+# caller has it already.
+def build_trends(data, habits=None):
+    if TIMESTAMP not in data.columns:
+        return None
+    columns = [column for column in SURVEY_SCHEMA if column in data.columns]
+    frame = data[columns + [PRIORITIES_MASK] if PRIORITIES_MASK in data.columns else columns]
+    frame = frame.assign(**{_DAY: response_days(data)})
+    frame.attrs = data.attrs
+    days = frame[_DAY].cat.categories.rename('Day')
+    codes = frame[_DAY].cat.codes.to_numpy()
+    dated = codes >= 0
+    habits = evaluate(data) if habits is None else habits
+    priorities = priority_counts_by(frame, _DAY)
+    trends = {
+        'responses': pd.Series(np.bincount(codes[dated], minlength=len(days)), index=days),
+        'answers': {column: table.T for column, table in breakdown(frame, _DAY, columns).items()},
+        'priorities': priorities,
+        'healthy': indicator_counts_by(habits, frame[_DAY]),
+        'scores': pd.Series(np.bincount(codes[dated], weights=habits[SCORE].to_numpy()[dated],
+                                        minlength=len(days)).astype(np.int64), index=days),
+        'undated': int((~dated).sum()),
+    }
+    return _map(trends, lambda table: table.rename_axis(index='Day'))
+
+
+# Apply `function` to every table of `trends`
+def _map(trends, function):
+    mapped = dict(trends)
+    for name in ('responses', 'priorities', 'healthy', 'scores'):
+        mapped[name] = function(trends[name])
+    mapped['answers'] = {column: function(table) for column, table in trends['answers'].items()}
+    return mapped
+
+
+# Sum two tables by day; answers missing on one side count 0
+def _add(total, part):
+    combined = pd.concat([total, part])
+    return combined.groupby(level=0).sum().astype(np.int64)
+
+
+# Add the trends of two sets of responses up
+def merge_trends(total, part):
+    merged = {name: _add(total[name], part[name]) for name in ('responses', 'priorities', 'healthy', 'scores')}
+    merged['answers'] = dict(total['answers'])
+    for column, table in part['answers'].items():
+        merged['answers'][column] = _add(merged['answers'][column], table) if column in merged['answers'] else table
+    merged['undated'] = total['undated'] + part['undated']
+    return merged
+
+
+# Fold newly arrived responses into `trends` (None to start over). Only the new
+# rows are read, so keeping trends up to date costs the same however long the
+# history is.
+def update_trends(trends, rows, habits=None):
+    part = build_trends(rows, habits)
+    if trends is None or part is None:
+        return part if trends is None else trends
+    return merge_trends(trends, part)
+
+
+# Trends in buckets of `freq`, one of the FREQUENCIES values. Buckets without
+# responses count 0.
+def resample_trends(trends, freq='D'):
+    return _map(trends, lambda table: table.resample(freq, label='left', closed='left').sum())
+
+
+# Daily trends summed over the `days` days up to and including each day
+def rolling_trends(trends, days):
+    return _map(trends, lambda table: table.resample('D').sum().rolling(days, min_periods=1).sum().astype(np.int64))
+
+
+# Percentage of the responses of each bucket
+def shares(table, responses):
+    return table.div(responses.where(responses > 0), axis=0).mul(100).fillna(0)